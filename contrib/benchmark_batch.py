@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares validating records with a new form per record with
+validating them with a BatchValidator."""
+import argparse
+import logging
+import timeit
+from formbar.batch import BatchValidator
+from formbar.config import Config, parse
+from formbar.form import Form
+
+ENTITY = """
+    <entity id="e%(num)s" name="field%(num)s" label="Field %(num)s"
+      type="integer" required="true">
+      <rule expr="$field%(num)s ge 16" msg="Too small"/>
+    </entity>"""
+
+
+def build_config(fields):
+    entities = "".join(ENTITY % {"num": num} for num in range(fields))
+    refs = "".join('<field ref="e%s"/>' % num for num in range(fields))
+    xml = ('<configuration><source>%s</source>'
+           '<form id="benchmark"><row><col>%s</col></row></form>'
+           '</configuration>' % (entities, refs))
+    return Config(parse(xml)).get_form("benchmark")
+
+
+def build_records(fields, count):
+    return [dict(("field%s" % num, str(15 + (num + i) % 3))
+                 for num in range(fields)) for i in range(count)]
+
+
+def main(args):
+    logging.disable(logging.WARNING)
+    config = build_config(args.fields)
+    records = build_records(args.fields, args.records)
+
+    def forms():
+        for values in records:
+            form = Form(config)
+            form.validate(values)
+            form.get_errors()
+
+    def batch():
+        for result in BatchValidator(config).validate(records):
+            pass
+
+    seconds = {}
+    for name, func in (("forms", forms), ("batch", batch)):
+        seconds[name] = min(timeit.repeat(func, number=1,
+                                          repeat=args.repeat))
+        print "%-8s %8.2f ms  %8.0f records/s" % (
+            name, seconds[name] * 1000, args.records / seconds[name])
+    print "speedup  %8.1fx" % (seconds["forms"] / seconds["batch"])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark batch validation')
+    parser.add_argument('--fields', type=int, default=50,
+                        help='Number of fields')
+    parser.add_argument('--records', type=int, default=500,
+                        help='Number of records')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of repetitions')
+    main(parser.parse_args())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares filtering the options of a relation field in Python with
+filtering the options in the database."""
+import argparse
+import timeit
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, relationship
+from formbar.config import Config, parse
+from formbar.fields import CollectionField
+from formbar.form import Form
+
+Base = declarative_base()
+
+CONFIG = """
+<configuration>
+  <source>
+    <entity id="e1" name="option" label="Option" type="manytoone">
+      <renderer type="dropdown"
+        filter="( %kind in ['a', 'b'] ) and %name != 'Option 1'"/>
+    </entity>
+  </source>
+  <form id="benchmark">
+    <field ref="e1"/>
+  </form>
+</configuration>
+"""
+
+
+class Option(Base):
+    __tablename__ = 'options'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    kind = Column(String)
+
+    def __unicode__(self):
+        return self.name
+
+
+class Item(Base):
+    __tablename__ = 'items'
+    id = Column(Integer, primary_key=True)
+    oid = Column(Integer, ForeignKey('options.id'))
+    option = relationship(Option)
+
+    def get_values(self):
+        return {}
+
+
+def setup(rows):
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all(Option(id=i, name=u"Option %s" % i, kind=u"abcd"[i % 4])
+                    for i in range(1, rows + 1))
+    item = Item()
+    session.add(item)
+    session.commit()
+    config = Config(parse(CONFIG)).get_form("benchmark")
+    return session, item, config
+
+
+def main(args):
+    session, item, config = setup(args.rows)
+    items = session.query(Option).all()
+
+    def get_field():
+        return Form(config, item, session).get_field("option")
+
+    def python():
+        field = get_field()
+        return list(CollectionField.iter_filtered_options(field, items))
+
+    def sql():
+        return list(get_field().iter_filtered_options(items))
+
+    assert python() == sql()
+    for name, func in (("python", python), ("sql", sql)):
+        seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print "%-8s %8.2f ms" % (name, seconds * 1000)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark filtering of relation options')
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='Number of options')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of repetitions')
+    main(parser.parse_args())
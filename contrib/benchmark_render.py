@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures the time needed to render the fields of a large form."""
+import argparse
+import logging
+import timeit
+from formbar.config import Config, parse
+from formbar.form import Form
+
+ENTITY = """
+    <entity id="e%(num)s" name="field%(num)s" label="Field %(num)s"
+      type="integer" required="true">
+      <rule expr="$field%(num)s ge 16" msg="Too small"/>
+      <help display="text">Help of field %(num)s</help>
+    </entity>"""
+
+
+def build_config(fields):
+    entities = "".join(ENTITY % {"num": num} for num in range(fields))
+    refs = "".join('<field ref="e%s"/>' % num for num in range(fields))
+    xml = ('<configuration><source>%s</source>'
+           '<form id="benchmark"><row><col>%s</col></row></form>'
+           '</configuration>' % (entities, refs))
+    return Config(parse(xml)).get_form("benchmark")
+
+
+def main(args):
+    logging.disable(logging.WARNING)
+    config = build_config(args.fields)
+    form = Form(config)
+    form.validate({})
+    renderers = [field.renderer for field in form.fields.values()]
+
+    def fields():
+        for renderer in renderers:
+            renderer.render()
+
+    def complete():
+        Form(config).render()
+
+    for name, func in (("fields", fields), ("form", complete)):
+        seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print "%-8s %8.2f ms  %6.3f ms/field" % (
+            name, seconds * 1000, seconds * 1000 / args.fields)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark rendering of fields')
+    parser.add_argument('--fields', type=int, default=400,
+                        help='Number of fields')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of repetitions')
+    main(parser.parse_args())
@@ -1,8 +1,10 @@
 import os
+import json
 from sqlalchemy.orm import scoped_session
 from wsgiref.simple_server import make_server
 from pyramid.config import Configurator
 from pyramid.response import Response
+from pyramid.httpexceptions import HTTPNotFound
 
 # FIXME: Why is this import needed? If not present the server will fail
 # to work. (ti) <2014-05-20 17:08>
@@ -10,9 +12,9 @@ from sqlalchemy.orm import scoped_session
 
 from mako.lookup import TemplateLookup
 from formbar import example_dir, logging
-from formbar.config import Config, load
+from formbar.config import load_cached
 from formbar.form import Form
-from formbar.rules import Rule
+from formbar.rules import Rule, evaluate_rules
 
 template_lookup = TemplateLookup(directories=[example_dir])
 
@@ -27,17 +29,45 @@ def set_current_form_page(request):
 
 def evaluate(request):
     """Will return a JSON response with the result of the evaluation of
-    the submitted formbar rule."""
+    the submitted formbar rule. All rules triggered by a change in the
+    form are submitted with one POST request as JSON list in the "rules"
+    parameter and the results are returned as list."""
+    if request.POST.get('rules'):
+        rules = json.loads(request.POST.get('rules'))
+        return {"success": True,
+                "data": evaluate_rules(rules)}
     rule = Rule(request.GET.get('rule'))
     result = rule.evaluate({})
     return {"success": True,
             "data": result,
             "params": {"msg": rule.msg}}
 
-def example(request):
-    config = Config(load(os.path.join(example_dir, 'example.xml')))
+def get_form(request):
+    config = load_cached(os.path.join(example_dir, 'example.xml'))
     form_config = config.get_form('example')
-    form = Form(form_config, eval_url="/evaluate", request=request)
+    return Form(form_config, eval_url="/evaluate", page_url="/page",
+                request=request)
+
+def page(request):
+    """Will return the rendered content of the requested page of the
+    form. Used to load pages on demand."""
+    form = get_form(request)
+    try:
+        return Response(form.render_page(int(request.GET.get('page'))))
+    except (TypeError, ValueError):
+        raise HTTPNotFound()
+
+def options(request):
+    """Will return the options of a field with a remoteselection
+    renderer matching the submitted search string."""
+    form = get_form(request)
+    field = form.get_field(request.GET.get('field'))
+    return field.search_options(request.GET.get('search'),
+                                int(request.GET.get('page', 1)),
+                                int(request.GET.get('pagesize', 20)))
+
+def example(request):
+    form = get_form(request)
 
     if request.POST:
         form.validate(request.POST)
@@ -54,10 +84,14 @@ if __name__ == '__main__':
     config.add_route('root', '/')
     config.add_route('ex1', '/example')
     config.add_route('evaluate', '/evaluate')
+    config.add_route('page', '/page')
+    config.add_route('options', '/options')
     config.add_route('set_current_form_page', '/set_current_form_page')
     config.add_view(example, route_name='root')
     config.add_view(example, route_name='ex1')
     config.add_view(evaluate, route_name='evaluate', renderer="json")
+    config.add_view(page, route_name='page')
+    config.add_view(options, route_name='options', renderer="json")
     config.add_view(set_current_form_page, route_name='set_current_form_page', renderer="json")
     config.add_static_view('bootstrap', 'bootstrap', cache_max_age=3600)
     config.add_static_view('css', 'css', cache_max_age=3600)
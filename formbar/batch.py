@@ -0,0 +1,167 @@
+"""Validation of many records against one form configuration. Usually
+used to import or re-validate large sets of data e.g from CSV or JSON
+files."""
+
+import logging
+import itertools
+import collections
+import multiprocessing
+from formbar.config import load_cached
+from formbar.form import Form
+
+log = logging.getLogger(__name__)
+
+
+class BatchValidator(object):
+    """Validates an iterable of records against a single form
+    configuration. In contrast to creating a new :class:`.Form` for
+    every record, the fields, renderers, converters and rules of the
+    form are only set up once and reused for all records. The validation
+    of each single record has the same semantic as
+    :func:`.Form.validate`.
+
+    Only the setup of the form is saved. The conversion and the
+    evaluation of the rules still happen for every record and usually
+    dominate the time needed for the validation, so the speedup depends
+    on the form. ``contrib/benchmark_batch.py`` measures about 1.5 to 2
+    times faster validation for a form with 50 fields and one rule per
+    field.
+
+    Example::
+
+        validator = BatchValidator(config.get_form("import"))
+        for ok, data, errors, warnings in validator.validate(records):
+            if ok:
+                save(data)
+    """
+
+    def __init__(self, config, dbsession=None, translate=None,
+                 locale=None, timezone=None, validators=None):
+        """
+        :config: Form configuration (:class:`.config.Form`)
+        :dbsession: Optional dbsession. Needed to convert the values of
+        relation fields.
+        :translate: Translation function used for the error messages.
+        :locale: String of the locale used to convert the values.
+        :timezone: String of the timezone used to convert the values.
+        :validators: Optional list of external :class:`.Validator`.
+        """
+        self._form = Form(config, dbsession=dbsession, translate=translate,
+                          locale=locale, timezone=timezone)
+        for validator in validators or []:
+            self._form.add_validator(validator)
+
+    def _reset(self):
+        """Resets the state of the form left from validating the
+        previous record."""
+        form = self._form
+        for field in form.fields.get_created():
+            field.errors = []
+            field.warnings = []
+        form.errors = []
+        form.warnings = []
+        form.data = {}
+        form.converted = {}
+        form.submitted_data = {}
+        form.validated = False
+
+    def validate_one(self, values, evaluate=True):
+        """Returns a tuple (ok, data, errors, warnings) of the
+        validation of the given values. `ok` is True if the validation
+        succeeds. `data` is the dictionary with the converted values and
+        is empty if the validation fails. `errors` and `warnings` are
+        dictionaries of lists of messages per fieldname as returned by
+        :func:`.Form.get_errors` and :func:`.Form.get_warnings`.
+
+        :values: Dictionary with submitted values of a single record.
+        :returns: Tuple (ok, data, errors, warnings)
+        """
+        self._reset()
+        form = self._form
+        ok = form.validate(values, evaluate=evaluate)
+        return ok, form.data, form.get_errors(), form.get_warnings()
+
+    def validate(self, records, evaluate=True):
+        """Generator which validates the given records one after the
+        other and yields a tuple (ok, data, errors, warnings) per
+        record in the order of the records. See :func:`validate_one`.
+
+        :records: Iterable of dictionaries with submitted values.
+        """
+        for values in records:
+            yield self.validate_one(values, evaluate)
+
+
+# Validator of the current worker process. See _init_worker.
+_worker_validator = None
+
+
+def _init_worker(path, form_id, locale, timezone):
+    """Initialises the :class:`BatchValidator` of a worker process. The
+    configuration is loaded once per worker."""
+    global _worker_validator
+    config = load_cached(path).get_form(form_id)
+    _worker_validator = BatchValidator(config, locale=locale,
+                                       timezone=timezone)
+
+
+def _validate_chunk(args):
+    records, evaluate = args
+    return list(_worker_validator.validate(records, evaluate))
+
+
+def _chunks(records, chunksize):
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_parallel(path, form_id, records, workers=None, chunksize=100,
+                      locale=None, timezone=None, evaluate=True):
+    """Generator which validates the given records in a pool of worker
+    processes and yields a tuple (ok, data, errors, warnings) per record
+    in the order of the records. Only the path of the configuration is
+    sent to the workers. Each worker loads the configuration once and
+    validates chunks of records with a :class:`BatchValidator`, so the
+    results are the same as in :func:`BatchValidator.validate`.
+
+    The records are read lazily. At most 2 * `workers` chunks are sent
+    to the pool and not yet yielded at the same time, so the memory
+    used for large iterables of records is bounded by about
+    2 * `workers` * `chunksize` records.
+
+    The records and the converted values must be picklable. Relation
+    fields are not supported as the workers have no dbsession.
+
+    :path: Path to the form configuration file.
+    :form_id: Id of the form in the configuration.
+    :records: Iterable of dictionaries with submitted values.
+    :workers: Number of worker processes. Defaults to the number of
+    CPUs.
+    :chunksize: Number of records which are sent to a worker at once.
+    :locale: String of the locale used to convert the values.
+    :timezone: String of the timezone used to convert the values.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (path, form_id, locale, timezone))
+    window = 2 * workers
+    pending = collections.deque()
+    try:
+        for chunk in _chunks(records, chunksize):
+            pending.append(pool.apply_async(_validate_chunk,
+                                            ((chunk, evaluate),)))
+            if len(pending) >= window:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
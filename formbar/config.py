@@ -1,6 +1,10 @@
 import os
 import re
+import copy
 import gettext
+import hashlib
+import threading
+import itertools
 import logging
 import pkg_resources
 import xml.etree.ElementTree as ET
@@ -25,26 +29,38 @@ def get_text_and_html_content(item):
     return item.text
 
 
-def load(path):
+def load(path, dependencies=None):
     """Return the parsed XML form the given file. The function will load
-    the file located in path and than returns the parsed content."""
+    the file located in path and than returns the parsed content.
+
+    :path: Path of the configuration file
+    :dependencies: Optional list. If provided the paths of all files
+    which are read while loading the configuration (the file itself
+    and all inherited and included files) are appended to the list.
+    :returns: DOM of the parsed XML
+    """
+    if dependencies is not None:
+        dependencies.append(path)
     with open(path) as f:
         data = f.read()
-        return parse(data, path)
+        return parse(data, path, dependencies)
 
 
-def parse(xml, path=None):
+def parse(xml, path=None, dependencies=None):
     """Returns the parsed XML. This is a helper function to be used in
     connection with loading the configuration files.
     :xml: XML string to be parsed
+    :path: Path of the loaded form
+    :dependencies: Optional list to collect the paths of inherited and
+    included files. See :func:`load`.
     :returns: DOM of the parsed XML
 
     """
     if isinstance(xml, unicode):
         xml = xml.encode("utf-8")
     tree = ET.fromstring(xml)
-    tree = handle_inheritance(tree, path)
-    tree = handle_includes(tree, path)
+    tree = handle_inheritance(tree, path, dependencies)
+    tree = handle_includes(tree, path, dependencies)
     return tree
 
 
@@ -58,12 +74,13 @@ def get_file_location(location, basepath):
     return location
 
 
-def handle_inheritance(tree, path=None):
+def handle_inheritance(tree, path=None, dependencies=None):
     """Will build a form based on a parent form. Will replace elements
     overwritten in the inherited form and add new elements.
 
     :tree: ElementTree
     :path: Path of the loaded form
+    :dependencies: Optional list to collect the paths of loaded files.
     :returns: ElementTree
 
     """
@@ -74,7 +91,8 @@ def handle_inheritance(tree, path=None):
 
     if not "inherits" in tree.attrib:
         return tree
-    ptree = load(get_file_location(tree.attrib["inherits"], basepath))
+    ptree = load(get_file_location(tree.attrib["inherits"], basepath),
+                 dependencies)
 
     # Workaroutn for missing support of getting parent elements. See
     # http://stackoverflow.com/
@@ -116,16 +134,17 @@ def handle_inheritance(tree, path=None):
                 pelement = ptree.find(xpath)
                 pelement.append(element)
 
-    ptree = handle_includes(ptree, path)
+    ptree = handle_includes(ptree, path, dependencies)
     return ptree
 
 
-def handle_includes(tree, path):
+def handle_includes(tree, path, dependencies=None):
     """Will replace all include element with the content of the include
     file.
 
     :tree: ElementTree
     :path: Path of the loaded form
+    :dependencies: Optional list to collect the paths of loaded files.
     :returns: ElementTree
 
     """
@@ -143,7 +162,8 @@ def handle_includes(tree, path):
         location = include_placeholder.attrib["src"]
         entity_prefix = include_placeholder.attrib.get("entity-prefix")
         element = include_placeholder.attrib.get("element")
-        include_tree = load(get_file_location(location, basepath))
+        include_tree = load(get_file_location(location, basepath),
+                            dependencies)
 
         if entity_prefix is not None:
             include_tree = handle_entity_prefix(include_tree, entity_prefix)
@@ -220,14 +240,10 @@ def filter_form_fields(form, fields, values=None):
     conditional will evaluate to true using the given set of values."""
     if values is None:
         values = {}
-    # FIXME: The only way get only fields which are
-    # relevant (e.g in evaluable conditionals) is to "reinit"
-    # the fields.
-    filtered_fields = flatten_form_fields(form.init_fields(values,
-                                                           evaluate=True))
+    active_fields = form.get_schema().get_active_fieldnames(values)
     tmp_fields = {}
     for fieldname, field in fields.iteritems():
-        if fieldname in filtered_fields:
+        if fieldname in active_fields:
             tmp_fields[fieldname] = field
     return tmp_fields
 
@@ -252,8 +268,20 @@ class Config(object):
             log.error(err)
             raise ValueError(err)
 
+        self._forms = {}
+        """Cache of the already initialised form configurations."""
+        self._digest = None
         self.build_index()
 
+    @property
+    def digest(self):
+        """Hexdigest of the SHA1 hash of the serialized configuration.
+        Identifies the content of the configuration e.g. in the keys of
+        cached fragments. It is computed once on first access."""
+        if self._digest is None:
+            self._digest = hashlib.sha1(ET.tostring(self._tree)).hexdigest()
+        return self._digest
+
     def build_index(self):
         index = {}
 
@@ -313,18 +341,118 @@ class Config(object):
     def get_form(self, id):
         """Returns a :class:`.Form` instance with the configuration for a form
         with id in the configuration file. If the form can not be found a
-        KeyError is raised.
+        KeyError is raised. The form configuration and its
+        :class:`FormSchema` are only initialised once per id. Every call
+        returns a new shallow copy of the configuration, so attributes
+        like ``readonly`` can be changed on the result without affecting
+        later calls. The schema is shared and must not be modified.
 
         :id: ID of the form in the configuration file
         :returns: ``FormConfig`` instance
 
         """
+        form = self._forms.get(id)
+        if form is not None:
+            return copy.copy(form)
         element = self.get_element('form', id)
         if element is None:
             err = 'Form with id "%s" can not be found' % id
             log.error(err)
             raise KeyError(err)
-        return Form(element, self)
+        form = Form(element, self)
+        form.get_schema()
+        self._forms[id] = form
+        return copy.copy(form)
+
+
+class ConfigCache(object):
+    """Process wide cache for parsed configurations. The cache holds
+    :class:`Config` instances with resolved inheritance and includes
+    keyed by the path of the configuration file. A cached configuration
+    is reloaded if the modification time or the size of the file itself
+    or of any inherited or included file has changed."""
+
+    def __init__(self):
+        self._configs = {}
+        """Dictionary with the path of the file as key and a tuple of the
+        configuration and the fingerprint of all loaded files."""
+        self._lock = threading.Lock()
+        self.hits = 0
+        """Number of configurations returned from the cache."""
+        self.misses = 0
+        """Number of configurations which needed to be (re)loaded."""
+
+    def _get_fingerprint(self, paths):
+        fingerprint = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime, stat.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def _is_valid(self, fingerprint):
+        return self._get_fingerprint([f[0] for f in fingerprint]) == fingerprint
+
+    def get(self, path):
+        """Returns the :class:`Config` for the configuration file located
+        in path. The configuration is loaded and put into the cache if
+        it is not cached yet or if one of the loaded files has been
+        changed since it was cached.
+
+        :path: Path of the configuration file
+        :returns: :class:`Config` instance
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            cached = self._configs.get(path)
+            if cached is not None and self._is_valid(cached[1]):
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+            dependencies = []
+            config = Config(load(path, dependencies))
+            self._configs[path] = (config,
+                                   self._get_fingerprint(dependencies))
+            return config
+
+    def invalidate(self, path):
+        """Removes the configuration for the given path from the
+        cache."""
+        with self._lock:
+            self._configs.pop(os.path.abspath(path), None)
+
+    def clear(self):
+        """Removes all configurations from the cache and resets the
+        counters."""
+        with self._lock:
+            self._configs.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dictionary with the number of cache hits, misses and
+        the number of cached configurations."""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._configs)}
+
+
+config_cache = ConfigCache()
+"""Default process wide :class:`ConfigCache` used by :func:`load_cached`."""
+
+
+def load_cached(path):
+    """Returns the :class:`Config` for the configuration file located in
+    path. In contrast to :func:`load` the configuration is only parsed
+    once per process and taken from the :data:`config_cache` afterwards
+    as long as none of the loaded files has been changed.
+
+    :path: Path of the configuration file
+    :returns: :class:`Config` instance
+    """
+    return config_cache.get(path)
 
 
 class Form(Config):
@@ -389,6 +517,16 @@ class Form(Config):
             "p2": [<formbar.config.Field>, ...]
         }
         """
+        self._schema = None
+        """Precompiled :class:`FormSchema` of this form. Will be build
+        on first access. See :func:`get_schema`"""
+
+    def get_schema(self):
+        """Returns the :class:`FormSchema` of the form. The schema is
+        built once and shared by all forms using this configuration."""
+        if self._schema is None:
+            self._schema = FormSchema(self)
+        return self._schema
 
     def get_buttons(self, root=None):
         # Get all Buttons for the form.
@@ -479,6 +617,36 @@ class Form(Config):
             elif child.tag == "field":
                 yield child
 
+    def walk_conditionals(self, root, conditionals=()):
+        """Will walk the tree recursivley like :func:`walk` and yields a
+        tuple for every field node. The tuple contains the field node
+        and a tuple with the expressions of all conditionals which
+        enclose the field node starting with the outermost conditional.
+
+        :root: Root node
+        :conditionals: Tuple of expressions of the conditionals
+        enclosing the root node.
+        :returns: yields tuples of field node and expressions.
+        """
+        for child in root:
+            if len(child) > 0:
+                if child.tag == "if":
+                    expr = child.attrib.get('expr')
+                    for elem in self.walk_conditionals(child,
+                                                       conditionals + (expr,)):
+                        yield elem
+                else:
+                    for elem in self.walk_conditionals(child, conditionals):
+                        yield elem
+            elif child.tag == "snippet":
+                sref = child.attrib.get('ref')
+                if sref:
+                    snippet = self._parent.get_element('snippet', sref)
+                    for elem in self.walk_conditionals(snippet, conditionals):
+                        yield elem
+            elif child.tag == "field":
+                yield child, conditionals
+
     def init_fields(self, values=None, evaluate=False):
         """Will return the fields in the form as a dictionary. The
         dicionary will containe all fields per page to make the access
@@ -550,6 +718,155 @@ class Form(Config):
             raise e
 
 
+class FormSchema(object):
+    """Precompiled read only representation of a form configuration. The
+    schema contains all information of the form configuration which are
+    needed to build a :class:`formbar.form.Form` without walking the
+    XML tree again: The flattened fields, the mapping of pages to
+    fields, the rules, validators and renderer configurations of the
+    fields.
+
+    The schema is shared between all forms which are build from the
+    same configuration, so it must not be modified after it has been
+    built."""
+
+    def __init__(self, form):
+        """Builds the schema from the given form configuration.
+
+        :form: :class:`Form` configuration
+        """
+        self.id = form.id
+        """ID of the form"""
+        self.pages = tuple(form.get_pages())
+        """Tuple of the page elements of the form"""
+        self.id2name = dict(form._id2name)
+        """Mapping of the entity ids to the fieldnames"""
+        self.page_fields = {}
+        """Dictionary with the fieldnames per page id"""
+        self.fields = {}
+        """Dictionary with all fields (:class:`Field`) of the form"""
+        fieldnames = []
+        for page_id, fields in form._fields.iteritems():
+            self.page_fields[page_id] = frozenset(fields.keys())
+            for name, field in fields.iteritems():
+                if name not in self.fields:
+                    fieldnames.append(name)
+                self.fields[name] = field
+        self.fieldnames = tuple(fieldnames)
+        """Tuple with the names of all fields in the form"""
+        self.rules = {}
+        """Dictionary with a tuple of rules per fieldname"""
+        self.validators = {}
+        """Dictionary with a tuple of validators (src, msg) per fieldname"""
+        self.renderers = {}
+        """Dictionary with the renderer configuration per fieldname"""
+        for name, field in self.fields.iteritems():
+            self.rules[name] = tuple(field.get_rules())
+            self.validators[name] = tuple(field.get_validators())
+            self.renderers[name] = field.renderer
+
+        # Index of the conditionals. For every field the expressions of
+        # the enclosing conditionals are saved. As a field can be
+        # included more than once in a form there might be more than one
+        # tuple of expressions per field.
+        conditionals = {}
+        pages = list(self.pages) or [form._tree]
+        for page in pages:
+            for node, exprs in form.walk_conditionals(page):
+                name = self.id2name[node.attrib.get('ref')]
+                conditionals.setdefault(name, set()).add(exprs)
+        self.conditionals = dict((name, frozenset(exprs))
+                                 for name, exprs in conditionals.iteritems())
+        """Dictionary with a set of tuples of expressions of the enclosing
+        conditionals per fieldname. Fields which are not within a
+        conditional have an empty tuple."""
+        self.expression_vars = {}
+        """Dictionary with the names of the variables which are
+        referenced in the expression of a conditional"""
+        for exprs in conditionals.itervalues():
+            for expr in itertools.chain(*exprs):
+                self.expression_vars[expr] = frozenset(_var_re.findall(expr))
+
+        dependents = {}
+        for name in self.fieldnames:
+            variables = set()
+            for rule in self.rules[name]:
+                variables.update(_var_re.findall(rule._expression))
+            for expr in itertools.chain(*self.conditionals.get(name, ())):
+                variables.update(self.expression_vars[expr])
+            for variable in variables:
+                dependents.setdefault(variable, set()).add(name)
+        self.dependents = dict((name, frozenset(fieldnames))
+                               for name, fieldnames in dependents.iteritems())
+        """Dictionary with the names of the fields whose rules or
+        conditionals reference the variable with the given name"""
+        self.option_tables = {}
+        """Dictionary with the compiled
+        :class:`formbar.fields.OptionTable` per fieldname and field
+        class. The tables are added on first use."""
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError("FormSchema is read only")
+        object.__setattr__(self, name, value)
+
+    def get_active_fieldnames(self, values):
+        """Returns a set with the names of all fields which are active
+        for the given values. A field is active if all conditionals
+        enclosing the field evaluate to True. Every distinct expression
+        is evaluated only once.
+
+        :values: Dictionary with values which are used for evaluating
+        the conditionals.
+        :returns: set of fieldnames
+        """
+        results = {}
+
+        def is_true(expr):
+            result = results.get(expr)
+            if result is None:
+                try:
+                    result = Rule(expr).evaluate(values)
+                except TypeError:
+                    # The rule refers to values which are not contained
+                    # in the values or could not be converted. See
+                    # Form.walk.
+                    result = False
+                results[expr] = result
+            return result
+
+        active = set()
+        for name, conditionals in self.conditionals.iteritems():
+            for exprs in conditionals:
+                if all(is_true(expr) for expr in exprs):
+                    active.add(name)
+                    break
+        return active
+
+    def get_affected_fieldnames(self, fieldnames):
+        """Returns a set with the names of the fields which are affected
+        by a change of the given fields. These are the fields itself
+        and all fields whose rules or conditionals reference one of the
+        given fields.
+
+        :fieldnames: Iterable with the names of the changed fields
+        :returns: set of fieldnames
+        """
+        affected = set(fieldnames)
+        for name in fieldnames:
+            affected.update(self.dependents.get(name, ()))
+        return affected
+
+    def get_page_fieldnames(self, page):
+        """Returns a set with the names of the fields on the given page.
+
+        :page: Page element
+        :returns: frozenset of fieldnames
+        """
+        return self.page_fields.get(page.attrib.get("id"), frozenset())
+
+
 class Field(Config):
     """Configuration of a Field"""
 
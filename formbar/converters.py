@@ -166,6 +166,32 @@ def to_integer_list(value):
     return map(to_integer, [v for v in value if v not in ("", None)])
 
 
+def load_items(clazz, ids, db, chunksize=500):
+    """Will return a list of the items of the given mapped class with
+    the given ids in the order of the ids. The items are loaded with one
+    `IN` query per chunk of ids. If one of the ids can not be found a
+    DeserializeException is raised.
+
+    :clazz: Mapped class
+    :ids: List of ids
+    :db: dbsession
+    :chunksize: Maximum number of ids in one query.
+    :returns: List of items
+
+    """
+    items = {}
+    ids = list(ids)
+    for start in range(0, len(ids), chunksize):
+        chunk = ids[start:start + chunksize]
+        for item in db.query(clazz).filter(clazz.id.in_(chunk)):
+            items[item.id] = item
+    missing = [unicode(id) for id in ids if id not in items]
+    if missing:
+        msg = _("Items with id %s can not be found.")
+        raise DeserializeException(msg, ", ".join(missing))
+    return [items[id] for id in ids]
+
+
 def to_manytomany(clazz, ids, db, selected):
     # The selected values must be in a list. So make sure they are a
     # list.
@@ -174,14 +200,17 @@ def to_manytomany(clazz, ids, db, selected):
     selected_ids = set(map(lambda s: s.id, selected))
 
     # Determine which items need to be added or removed from the
-    # relation.
+    # relation. Keep the order of the given ids for new items.
+    add_ids = []
+    seen = set(selected_ids)
+    for id in ids:
+        if id not in seen:
+            seen.add(id)
+            add_ids.append(id)
     ids = set(ids)
-    add_ids = ids.difference(selected_ids)
-    delete_ids = selected_ids.difference(ids)
 
-    related_items = filter(lambda x: x.id not in delete_ids, selected)
-    for id in add_ids:
-        related_items.append(db.query(clazz).filter(clazz.id == id).one())
+    related_items = filter(lambda x: x.id in ids, selected)
+    related_items.extend(load_items(clazz, add_ids, db))
     return related_items
 
 
@@ -191,7 +220,7 @@ def to_onetomany(clazz, ids, db, selected):
 
 def to_manytoone(clazz, id, db, selected):
     if not selected or selected.id != id:
-        return db.query(clazz).filter(clazz.id == id).one()
+        return load_items(clazz, [id], db)[0]
     return selected
 
 
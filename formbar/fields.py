@@ -4,7 +4,8 @@ import logging
 import datetime
 import re
 import sqlalchemy as sa
-from formbar.rules import Rule, Expression
+from collections import Mapping, MutableMapping, OrderedDict
+from formbar.rules import Rule, Expression, get_ast, to_ast, evaluate_columns
 import formbar.config as config
 
 log = logging.getLogger(__name__)
@@ -222,6 +223,62 @@ class FieldFactory(object):
         return Field(self.form, fieldconfig, self.translate, sa_property)
 
 
+class LazyFields(MutableMapping):
+    """Dictionary of the fields of a form. A field is only created by
+    the :class:`FieldFactory` on the first access of the field.
+    Iterating over the mapping returns the names of all fields without
+    creating them. Fields can be set and deleted like in a dictionary."""
+
+    def __init__(self, factory, fieldconfigs, fieldnames):
+        """
+        :factory: :class:`FieldFactory` used to create the fields.
+        :fieldconfigs: Dictionary with the field configurations.
+        :fieldnames: Ordered names of the fields.
+        """
+        self._factory = factory
+        self._configs = fieldconfigs
+        # The names are copied as they are shared with the schema.
+        self._names = list(fieldnames)
+        self._keys = set(fieldnames)
+        self._fields = {}
+
+    def __getitem__(self, name):
+        field = self._fields.get(name)
+        if field is None:
+            if name not in self._keys:
+                raise KeyError(name)
+            field = self._factory.create(self._configs[name])
+            self._fields[name] = field
+        return field
+
+    def __setitem__(self, name, field):
+        if name not in self._keys:
+            self._keys.add(name)
+            self._names.append(name)
+        self._fields[name] = field
+
+    def __delitem__(self, name):
+        if name not in self._keys:
+            raise KeyError(name)
+        self._keys.remove(name)
+        self._names.remove(name)
+        self._fields.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._keys
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def get_created(self):
+        """Returns a list of the fields which have already been
+        created."""
+        return self._fields.values()
+
+
 class Field(object):
     """Wrapper for fields in the form. The purpose of this class is to
     provide a common interface for the renderer independent to the
@@ -233,12 +290,11 @@ class Field(object):
         :config: Field configuration
 
         """
-        from formbar.renderer import get_renderer
+        self._renderer = None
         self.value = None
         self._config = config
         self._form = form
         self._translate = translate
-        self.renderer = get_renderer(self, translate)
         self._sa_property = sa_property
 
         self.errors = []
@@ -247,8 +303,8 @@ class Field(object):
         self.desired = getattr(self._config, "desired")
         self.readonly = getattr(self._config, "readonly")
 
-        if self.name in self._form.merged_data:
-            self.value = self._form.merged_data[self.name]
+        if self.name in self._form._initial_data:
+            self.value = self._form._initial_data[self.name]
 
         # Only set default value if the current value of the form is not
         # "empty"
@@ -270,6 +326,19 @@ class Field(object):
     #     #_type = "type:\t\t{}".format(self.get_type())
     #     return "\n".join([field, required, desired, value, _type, rules])+"\n"
 
+    @property
+    def renderer(self):
+        """Renderer of the field. The renderer is created on first
+        access."""
+        if self._renderer is None:
+            from formbar.renderer import get_renderer
+            self._renderer = get_renderer(self, self._translate)
+        return self._renderer
+
+    @renderer.setter
+    def renderer(self, renderer):
+        self._renderer = renderer
+
     def _handle_expression(self, value):
         # If value begins with '%' then consider the following string as
         # a brabbel expression and set the value of the default value to
@@ -341,8 +410,9 @@ class Field(object):
         return value
 
     def get_rules(self):
-        """Returns a list of configured rules for the field."""
-        return self._config.get_rules()
+        """Returns a list of configured rules for the field. The rules
+        are taken from the precompiled schema of the form."""
+        return list(self._form._schema.rules[self.name])
 
     def set_value(self, value):
         self.value = value
@@ -404,9 +474,15 @@ class Field(object):
         return self.warnings
 
     def render(self, active):
-        """Returns the rendererd HTML for the field"""
-        self.renderer._active = active
-        return self.renderer.render()
+        """Returns the rendererd HTML for the field. Readonly fields are
+        taken from the fragment cache of the form if available."""
+        renderer = self.renderer
+        renderer._active = active
+        cache = self._form._fragment_cache
+        if (cache is None or not self.readonly
+           or self.errors or self.warnings):
+            return renderer.render()
+        return cache.render(renderer.get_cache_key(cache), renderer.render)
 
 # Singlevalue Fields.
 #####################################
@@ -547,16 +623,48 @@ class CollectionField(Field):
     ::class::SelectionField.  If the values are defined by the relations
     in the database please check ::class::RelationField."""
 
+    def __init__(self, form, config, translate, sa_property=None):
+        self._options = None
+        self._option_index = None
+        super(CollectionField, self).__init__(form, config, translate,
+                                              sa_property)
+
+    def get_cached_options(self):
+        """Will return the options of the field as returned by
+        :func:`get_options`. The options are only loaded on the first
+        call. See :func:`clear_options`."""
+        if self._options is None:
+            self._options = self.get_options()
+        return self._options
+
+    def get_option_index(self):
+        """Will return an ordered dictionary with the serialized value
+        of each option as key. The value is a tuple of the position of
+        the option and its label. The index is build only once from
+        :func:`get_cached_options`."""
+        if self._option_index is None:
+            index = OrderedDict()
+            for pos, option in enumerate(self.get_cached_options()):
+                key = unicode(option[1])
+                if key not in index:
+                    index[key] = (pos, "%s" % option[0])
+            self._option_index = index
+        return self._option_index
+
+    def clear_options(self):
+        """Removes the cached options and the option index. Must be
+        called if values used in the filter of the options change."""
+        self._options = None
+        self._option_index = None
+
     def expand_value(self, value):
-        ex_values = []
         if not isinstance(value, list):
             value = [value]
-        options = self.get_options()
-        for opt in options:
-            for v in value:
-                if unicode(v) == unicode(opt[1]):
-                    ex_values.append("%s" % opt[0])
-        return ", ".join(ex_values)
+        index = self.get_option_index()
+        ex_values = [index[unicode(v)] for v in value if unicode(v) in index]
+        # Labels are returned in the order of the options.
+        ex_values.sort(key=lambda x: x[0])
+        return ", ".join(label for pos, label in ex_values)
 
     def get_previous_value(self, default="", expand=False):
         value = super(CollectionField, self).get_previous_value(default)
@@ -600,7 +708,15 @@ class CollectionField(Field):
         raise NotImplementedError()
 
     def _build_filter_rule(self, expr_str, item):
-        return Rule(self.parse_expression(expr_str))
+        expr_str = self.parse_expression(expr_str)
+        if isinstance(expr_str, unicode):
+            # Brabbel only resolves variables in byte strings but the
+            # substituted values make the expression unicode.
+            try:
+                expr_str = expr_str.encode("ascii")
+            except UnicodeEncodeError:
+                pass
+        return Rule(expr_str)
 
     def parse_expression(self, expr_str):
         tokens = re.split("\s", expr_str)
@@ -705,14 +821,21 @@ class CollectionField(Field):
         :returns: List of tuples.
 
         """
+        return list(self.iter_filtered_options(options))
+
+    def iter_filtered_options(self, options):
+        """Generator version of :func:`filter_options`. The options are
+        filtered one after the other while iterating."""
         is_filtering_configured = self._config.renderer and self._config.renderer.filter
         if is_filtering_configured:
             rule = self._build_filter_rule(self._config.renderer.filter, None)
             x = re.compile("\$[\w\.]+")
             values = x.findall(rule._expression)
-            return [self.do_filter_options(option, values, rule) for option in options]
+            for option in options:
+                yield self.do_filter_options(option, values, rule)
         else:
-            return [self.dont_filter_options(option) for option in options]
+            for option in options:
+                yield self.dont_filter_options(option)
 
     def dont_filter_options(self, option):
         label, value = self.explode_option(option)
@@ -745,26 +868,113 @@ class CollectionField(Field):
         return o_label, o_value
 
 
+class OptionTable(object):
+    """Compiled table of the options defined in the configuration of a
+    selection field. The labels and the converted values of the options
+    are stored in the configured sort order. The attributes of the
+    options which can be used in filters are stored as columns with the
+    string representation of the attribute of every option. Tables are
+    build once per form configuration and must not be modified."""
+
+    def __init__(self, options, convert, sort=False, reverse=False):
+        """
+        :options: List of tuples (label, value, attributes) of the
+        options as defined in the configuration.
+        :convert: Function to convert the value of an option.
+        :sort: If True the options are sorted by their label.
+        :reverse: If True the sort order is descending.
+        """
+        if sort:
+            options = sorted(options, key=lambda x: unicode(x[0]),
+                             reverse=reverse)
+        self.labels = tuple(option[0] for option in options)
+        """Tuple with the labels of the options"""
+        self.values = tuple(convert(option[1]) for option in options)
+        """Tuple with the converted values of the options"""
+        names = set()
+        for option in options:
+            names.update(option[2].keys())
+        self.columns = dict((name, tuple(unicode(option[2].get(name, ""))
+                                         for option in options))
+                            for name in names)
+        """Dictionary with a tuple of the values of each attribute"""
+
+    def __len__(self):
+        return len(self.labels)
+
+    def get_column(self, name):
+        """Will return a tuple with the value of the attribute with the
+        given name for every option. Options without the attribute have
+        an empty string."""
+        column = self.columns.get(name)
+        if column is None:
+            column = (u"",) * len(self)
+        return column
+
+
 class SelectionField(CollectionField):
     """Field which can have one or more of predefined values. The
     values are defined in the fields config."""
 
+    def _convert_option_value(self, value):
+        if value == '':
+            return ''
+        elif isinstance(self, IntSelectionField):
+            return int(value)
+        elif isinstance(self, BooleanSelectionField):
+            from formbar.converters import to_boolean
+            return to_boolean(value)
+        return value
+
+    def get_option_table(self):
+        """Will return the :class:`OptionTable` of the options defined
+        in the configuration of the field. The table is build only once
+        and is shared by all forms using the same form configuration."""
+        key = (self.name, self.__class__)
+        tables = self._form._schema.option_tables
+        table = tables.get(key)
+        if table is None:
+            renderer = self._config.renderer
+            sort = bool(renderer and renderer.sort)
+            reverse = sort and renderer.sortorder == "desc"
+            table = OptionTable(self._config.options,
+                                self._convert_option_value, sort, reverse)
+            table = tables.setdefault(key, table)
+        return table
+
+    def filter_option_table(self, table):
+        """Will return a list with a flag for every option in the given
+        :class:`OptionTable` which is True if the option passes the
+        filter configured in the renderer. The filter is evaluated
+        in the same way as in :func:`do_filter_options`.
+
+        Simple filters are evaluated on the columns of the table at once
+        (see :func:`formbar.rules.evaluate_columns`). All other filters
+        are evaluated for every option."""
+        renderer = self._config.renderer
+        if not (renderer and renderer.filter):
+            return [True] * len(table)
+        rule = self._build_filter_rule(renderer.filter, None)
+        try:
+            return evaluate_columns(to_ast(rule._expression_tree),
+                                    table.get_column, len(table))
+        except ValueError:
+            log.debug("Filter %s is evaluated per option" % rule._expression)
+        columns = [(key.strip("$"), table.get_column(key.strip("$")))
+                   for key in re.findall("\$[\w\.]+", rule._expression)]
+        return [rule.evaluate(dict((key, column[i])
+                                   for key, column in columns))
+                for i in range(len(table))]
+
     def get_options(self):
         options = []
         user_defined_options = self._config.options
         if isinstance(user_defined_options, list) and \
            len(user_defined_options) > 0:
-            for option in self.filter_options(user_defined_options):
-                if option[1] == '':
-                    value = ''
-                elif isinstance(self, IntSelectionField):
-                    value = int(option[1])
-                elif isinstance(self, BooleanSelectionField):
-                    from formbar.converters import to_boolean
-                    value = to_boolean(option[1])
-                else:
-                    value = option[1]
-                options.append((option[0], value, option[2]))
+            # The table is already sorted.
+            table = self.get_option_table()
+            return zip(table.labels, table.values,
+                       self.filter_option_table(table))
         elif isinstance(user_defined_options, str):
             for option in self._form.merged_data.get(user_defined_options):
                 options.append((option[0], option[1], True))
@@ -830,6 +1040,151 @@ class BooleanSelectionField(SelectionField):
 ############################
 
 
+def _get_filter_column(clazz, node):
+    if node[0] != "var":
+        raise ValueError("%s is not a variable" % node)
+    try:
+        prop = sa.inspect(clazz).column_attrs[node[1]]
+        python_type = prop.columns[0].type.python_type
+    except (KeyError, NotImplementedError):
+        raise ValueError("%s is not a column" % node[1])
+    return getattr(clazz, node[1]), python_type
+
+
+def _coerce_filter_value(python_type, node):
+    # The filter is evaluated on the string representation of the
+    # values of the options. So only string literals are compared and
+    # converted into the type of the column if the conversion is
+    # unambiguous.
+    if node[0] != "lit" or not isinstance(node[1], basestring):
+        raise ValueError("%s is not a string" % node)
+    value = node[1]
+    if issubclass(python_type, basestring):
+        return value
+    elif python_type is bool and value in (u"True", u"False"):
+        return value == u"True"
+    elif python_type in (int, long) and unicode(int(value)) == value:
+        return int(value)
+    raise ValueError("Can not compare %s with %s" % (value, python_type))
+
+
+def _build_filter_clause(clazz, node):
+    op = node[0]
+    if op in ("and", "or"):
+        left = _build_filter_clause(clazz, node[1])
+        right = _build_filter_clause(clazz, node[2])
+        return sa.and_(left, right) if op == "and" else sa.or_(left, right)
+    elif op == "not":
+        return sa.not_(_build_filter_clause(clazz, node[1]))
+    elif op in ("==", "!="):
+        if node[1][0] == "lit":
+            node = [op, node[2], node[1]]
+        column, python_type = _get_filter_column(clazz, node[1])
+        value = _coerce_filter_value(python_type, node[2])
+        # The value of a NULL column is u"None" in the string
+        # representation. Comparisons must be either true or false to
+        # get the same result for "not".
+        isnull = value == u"None"
+        if op == "==":
+            if isnull:
+                return sa.or_(column == None, column == value)
+            return sa.and_(column != None, column == value)
+        if isnull:
+            return sa.and_(column != None, column != value)
+        return sa.or_(column == None, column != value)
+    elif op == "in":
+        column, python_type = _get_filter_column(clazz, node[1])
+        if node[2][0] != "lit" or not isinstance(node[2][1], list):
+            raise ValueError("%s is not a list" % node[2])
+        values = [_coerce_filter_value(python_type, ["lit", v])
+                  for v in node[2][1]]
+        if u"None" in values:
+            raise ValueError("Can not compare NULL values in lists")
+        if not values:
+            return sa.false()
+        return sa.and_(column != None, column.in_(values))
+    raise ValueError("Operator %s is not supported" % op)
+
+
+def escape_like(value):
+    """Returns the given string with the wildcards of a LIKE pattern
+    ("%" and "_") and the escape character "\\" escaped by "\\".
+
+    :value: String
+    :returns: Escaped string
+    """
+    return (value.replace("\\", "\\\\").replace("%", "\\%")
+            .replace("_", "\\_"))
+
+
+def build_filter_clause(clazz, tree):
+    """Will return a SQLAlchemy clause which can be used to filter the
+    items of the given mapped class in the database. The clause is build
+    from the syntax tree of a filter expression (see
+    :func:`formbar.rules.to_ast`) in which variables refer to the
+    columns of the class. Supported are comparisons of columns with
+    string literals using "==", "!=" and "in" combined with "and",
+    "or" and "not". The result of the clause is the same as evaluating
+    the expression on the string representation of the column values
+    in :func:`CollectionField.do_filter_options`.
+
+    :clazz: Mapped class
+    :tree: Syntax tree of the filter expression
+    :returns: SQLAlchemy clause or None if the expression can not be
+    translated.
+    """
+    if tree is None:
+        return None
+    try:
+        return _build_filter_clause(clazz, tree)
+    except (ValueError, TypeError, IndexError):
+        log.debug("Can not build SQL filter from %s" % tree)
+        return None
+
+
+class RelationOptionLoader(object):
+    """Loads the options of relation fields. The items of a mapped
+    class are loaded with a single query on the first request and are
+    shared by all fields (and their renderers) which refer to the same
+    class. Usually every form has its own loader, but a loader can be
+    shared by all forms within one request."""
+
+    def __init__(self, dbsession, request=None):
+        """
+        :dbsession: dbsession used to load the items.
+        :request: Optional current request. See :func:`load`.
+        """
+        self._dbsession = dbsession
+        self._request = request
+        self._items = {}
+        self.queries = 0
+        """Number of issued queries."""
+
+    def load(self, clazz):
+        """Returns a list of all items of the given mapped class. The
+        items are loaded on the first call per class and cached in the
+        loader. If the class provides the optimised loading of Ringo
+        (`_sql_eager_loads`) and a request is given, the items are
+        loaded with `get_item_list` of the class.
+
+        :clazz: Mapped class
+        :returns: List of items
+        """
+        items = self._items.get(clazz)
+        if items is None:
+            if hasattr(clazz, "_sql_eager_loads") and self._request:
+                items = clazz.get_item_list(self._request, user=None).items
+            else:
+                items = self._dbsession.query(clazz).all()
+            self.queries += 1
+            self._items[clazz] = list(items)
+        return self._items[clazz]
+
+    def clear(self):
+        """Removes all loaded items."""
+        self._items.clear()
+
+
 class RelationField(CollectionField):
     """Field which can have one or more of predefined values. The values
     are defined through the relation in the database.  Please note that
@@ -866,31 +1221,140 @@ class RelationField(CollectionField):
         sa_property = get_sa_property(self._form._item, self._config.name)
         return sa_property.mapper.class_
 
+    def get_filter_clause(self, clazz):
+        """Will return the filter configured in the renderer as SQL
+        clause for the given mapped class. Returns None if no filter is
+        configured or the filter can not be translated into SQL. See
+        :func:`build_filter_clause`."""
+        renderer = self._config.renderer
+        if not (renderer and renderer.filter):
+            return None
+        expr = self.parse_expression(renderer.filter)
+        return build_filter_clause(clazz, get_ast(expr))
+
+    def iter_filtered_options(self, options):
+        """Filters the given options in the database if the configured
+        filter can be translated into SQL. Otherwise the filter is
+        evaluated for each option in :func:`do_filter_options`."""
+        try:
+            clazz = self._get_sa_mapped_class()
+            clause = self.get_filter_clause(clazz)
+        except AttributeError:
+            clause = None
+        if clause is None:
+            for option in CollectionField.iter_filtered_options(self, options):
+                yield option
+            return
+        query = self._form._dbsession.query(clazz.id).filter(clause)
+        visible = set(id for id, in query)
+        for option in options:
+            yield (option, option.id, option.id in visible)
+
     def get_options(self):
         options = []
         try:
             clazz = self._get_sa_mapped_class()
-            # The following code will enable optimzed loading of options
-            # in case that the are handling ringo items. If the class
-            # has a certain attribute we will use a optimzed loading
-            # strategy of within Ringo. Otherwise stay with the old
-            # mechanism. This is some some sort of a hack and *not* a
-            # ideal solution as it itroduces a deeper dependency to the
-            # ringo application. But as this relation code has
-            # implicit assumptions on the structure of the request it
-            # doesn't hurt too much. I expect that the generality of
-            # formbar as form rendering lib is not affected by this
-            # change.
-            if hasattr(clazz, "_sql_eager_loads") and self._form._request:
-                unfiltered = clazz.get_item_list(self._form._request, user=None).items
-            else:
-                unfiltered = self._form._dbsession.query(clazz)
+            # Items are loaded once per class and form. See
+            # RelationOptionLoader.
+            unfiltered = self._form._option_loader.load(clazz)
             options.extend(self.filter_options(unfiltered))
         except Exception as e:
             log.error("Failed to load options for '%s' "
                       "to load the option from db" % self.name)
         return options
 
+    def search_options(self, search=None, page=1, pagesize=20):
+        """Will return a dictionary with one page of the options of the
+        field which match the given search string. Only options which
+        pass the configured filter of the renderer are returned. The
+        dictionary can be directly returned as JSON response and has the
+        following keys:
+
+        * options: List of dictionaries with the label and the value
+          of the options.
+        * page: The number of the returned page.
+        * more: True if there are further options on the next pages.
+
+        If the renderer defines a `search` attribute, the search is done
+        in the database on the column with this name. Otherwise the
+        search string is searched in the label of the options. The
+        options are ordered by their id. If the search and the filter
+        can be done in the database, only the requested page is loaded.
+
+        :search: String which must be contained in the options.
+        :page: Number of the page. The first page has the number 1.
+        :pagesize: Number of options per page.
+        :returns: Dictionary
+        """
+        clazz = self._get_sa_mapped_class()
+        renderer = self._config.renderer
+        # Options are ordered to get the same pages on every request.
+        query = self._form._dbsession.query(clazz).order_by(clazz.id)
+        column = renderer and renderer.search
+        if search and column:
+            query = query.filter(getattr(clazz, column).ilike(
+                u"%%%s%%" % escape_like(search), escape="\\"))
+            search = None
+        if search:
+            search = search.lower()
+        clause = self.get_filter_clause(clazz)
+        start = (max(page, 1) - 1) * pagesize
+        if not search and (clause is not None
+                           or not (renderer and renderer.filter)):
+            # All options of the query are visible, so the page can be
+            # loaded from the database.
+            if clause is not None:
+                query = query.filter(clause)
+            items = query.offset(start).limit(pagesize + 1).all()
+            options = [{"label": unicode(label), "value": value}
+                       for label, value, visible in
+                       map(self.dont_filter_options, items[:pagesize])]
+            return {"options": options, "page": page,
+                    "more": len(items) > pagesize}
+        if clause is not None:
+            candidates = (self.dont_filter_options(item)
+                          for item in query.filter(clause))
+        else:
+            candidates = self.iter_filtered_options(query)
+        options = []
+        more = False
+        matched = 0
+        for label, value, visible in candidates:
+            if not visible:
+                continue
+            label = unicode(label)
+            if search and search not in label.lower():
+                continue
+            if matched >= start + pagesize:
+                more = True
+                break
+            if matched >= start:
+                options.append({"label": label, "value": value})
+            matched += 1
+        return {"options": options, "page": page, "more": more}
+
+    def get_selected_options(self):
+        """Will return a list of tuples with the label and the value of
+        the selected options of the field. Only the selected items are
+        loaded from the database."""
+        value = self.value
+        if value in (None, ""):
+            return []
+        if not isinstance(value, list):
+            value = [value]
+        items = [v for v in value if hasattr(v, "id")]
+        ids = [v for v in value if not hasattr(v, "id") and v not in ("", None)]
+        if ids:
+            from formbar.converters import load_items, to_integer
+            try:
+                items.extend(load_items(self._get_sa_mapped_class(),
+                                        [to_integer(v) for v in ids],
+                                        self._form._dbsession))
+            except Exception:
+                log.error("Failed to load selected options for '%s'"
+                          % self.name)
+        return [(item, item.id) for item in items]
+
 
 class ManytooneRelationField(RelationField):
 
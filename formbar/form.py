@@ -3,7 +3,8 @@ import importlib
 import inspect
 import sqlalchemy as sa
 from formbar.renderer import FormRenderer
-from formbar.fields import FieldFactory
+from formbar.fields import (FieldFactory, LazyFields, RelationOptionLoader,
+                            CollectionField)
 from formbar.converters import (
     DeserializeException, from_python, to_python
 )
@@ -133,17 +134,24 @@ class Validator(object):
 
         """
         self._field = field
+        self._msg = error
         self._error = error
         self._callback = callback
         self._context = context
         self._triggers = triggers
+        self._nargs = None
 
     def check(self, data):
         """Checker method which will call the callback of the validator
         to actually do the validation on the provided data. Will return
-        True or False."""
+        True or False. The error message is reset to the configured
+        message on every call as a :class:`ValidationException` of a
+        previous check might have changed it."""
+        self._error = self._msg
+        if self._nargs is None:
+            self._nargs = len(inspect.getargspec(self._callback).args)
         try:
-            if len(inspect.getargspec(self._callback).args) == 2:
+            if self._nargs == 2:
                 return self._callback(self._field, data)
             else:
                 return self._callback(self._field, data, self._context)
@@ -152,6 +160,39 @@ class Validator(object):
             return False
 
 
+class ValidationResult(object):
+    """Result of a form validation. The result contains the submitted
+    and converted values as well as the errors and warnings of the
+    fields. It can be stored (e.g in the session) and used as base for a
+    later incremental validation. See :func:`Form.validate_incremental`"""
+
+    def __init__(self, submitted, converted, errors, warnings,
+                 field_errors=None, field_warnings=None):
+        """
+        :submitted: Dictionary with the submitted (serialized) values.
+        :converted: Dictionary with the converted python values.
+        :errors: Dictionary with a list of errors per fieldname.
+        :warnings: Dictionary with a list of warnings per fieldname.
+        :field_errors: Dictionary with a list of errors per fieldname
+        without the errors of external validators. Defaults to errors.
+        :field_warnings: Dictionary with a list of warnings per
+        fieldname without the warnings of external validators. Defaults
+        to warnings.
+        """
+        self.submitted = submitted
+        self.converted = converted
+        self.errors = _copy_messages(errors)
+        self.warnings = _copy_messages(warnings)
+        self.field_errors = _copy_messages(
+            errors if field_errors is None else field_errors)
+        self.field_warnings = _copy_messages(
+            warnings if field_warnings is None else field_warnings)
+
+
+def _copy_messages(messages):
+    return dict((k, list(v)) for k, v in messages.iteritems())
+
+
 class Form(object):
     """Class for forms. The form will take care for rendering the form,
     validating the submitted data and saving the data back to the
@@ -171,7 +212,8 @@ class Form(object):
     def __init__(self, config, item=None, dbsession=None, translate=None,
                  change_page_callback={}, renderers={}, request=None,
                  csrf_token=None, eval_url=None, url_prefix="", locale=None,
-                 values=None, timezone=None):
+                 values=None, timezone=None, page_url=None,
+                 fragment_cache=None, option_loader=None):
         """Initialize the form with ``Form`` configuration instance and
         optional an SQLAlchemy mapped object.
 
@@ -204,8 +246,21 @@ class Form(object):
                  the rendered form.
         :timezone: String of the timezone of the form. E.g.
         Europe/Berlin. Used for proper display of the datetime.
+        :page_url: External URL to load the content of a single page. If
+        the form is rendered with `only_page` the content of the other
+        pages is loaded from this URL with a AJAX request on demand. The
+        number of the page is provided in the "page" parameter of a GET
+        request. The response is the HTML returned by
+        :func:`render_page`.
+        :fragment_cache: Optional :class:`.renderer.FragmentCache` used to
+        cache the rendered HTML of readonly fields and pages.
+        :option_loader: Optional :class:`.fields.RelationOptionLoader` to
+        load the options of relation fields. Can be used to share the
+        loaded options between different forms within one request. If
+        not provided each form has its own loader.
         """
         self._config = config
+        self._schema = config.get_schema()
         self._item = item
         self._dbsession = dbsession
         self._request = request
@@ -214,6 +269,13 @@ class Form(object):
         self._eval_url = eval_url
         if self._url_prefix:
             self._eval_url = self._url_prefix + self._eval_url
+        self._page_url = page_url
+        self._fragment_cache = fragment_cache
+        if option_loader is None:
+            option_loader = RelationOptionLoader(dbsession, request)
+        self._option_loader = option_loader
+        if self._url_prefix and self._page_url:
+            self._page_url = self._url_prefix + self._page_url
 
         if locale:
             self._locale = locale
@@ -232,6 +294,7 @@ class Form(object):
         is False.  which means no validation has been done."""
         self.external_validators = []
         """List with external validators. Will be called an form validation."""
+        self._configured_validators = {}
         self.current_page = 0
         """Number of the currently selected page"""
         if self.pages:
@@ -257,10 +320,13 @@ class Form(object):
         """This is merged date from the initial data loaded from the
         given item and userprovided values on form initialisation. The
         user defined values are merged again on render time"""
+        self._initial_data = dict(self.merged_data)
+        """Copy of the merged data on form initialisation. Used to
+        initialise the lazily created fields."""
         self.external_renderers = renderers
         """Dictionary with external provided custom renderers."""
         self.fields = self._build_fields()
-        """Dictionary with fields."""
+        """Dictionary with fields. Fields are created on first access."""
         self.data = {}
         """After submission this Dictionary will contain the
         validated data on successfull validation. Else this Dictionary
@@ -271,9 +337,14 @@ class Form(object):
         self.converted = {}
         """This is the data which is converted to python values
          during validation time"""
-        # set default values
-        for field in self.fields:
-            if self.fields[field].value:
+        self.result = None
+        """:class:`ValidationResult` of the last validation. Can be used
+        as base for :func:`validate_incremental`"""
+        # set default values. Only fields with a configured default
+        # value can change the merged data.
+        for field in self._schema.fieldnames:
+            if (self._schema.fields[field].value
+               and self.fields[field].value):
                 self.merged_data[field] = self.fields[field].value
         self.warnings = []
         """Form wide warnings. This list contains warnings which affect
@@ -302,7 +373,7 @@ class Form(object):
         values = {}
         if not self._item:
             return values
-        for name, field in self._config.get_fields().iteritems():
+        for name in self._schema.fieldnames:
             try:
                 values[name] = getattr(self._item, name)
             except AttributeError:
@@ -319,7 +390,7 @@ class Form(object):
 
         """
         filtered = {}
-        for fieldname, field in self.fields.iteritems():
+        for fieldname in self.fields:
             if fieldname in values:
                 filtered[fieldname] = values[fieldname]
         return filtered
@@ -367,30 +438,29 @@ class Form(object):
 
     def _build_fields(self):
         """Returns a dictionary with all Field instances which are
-        configured for this form.
-        :returns: Dictionary with Field instances
+        configured for this form. The Field instances are created
+        lazily on first access.
+        :returns: :class:`LazyFields` with Field instances
 
         """
-        fields = {}
         factory = FieldFactory(self, self._translate)
-        for name, field in self._config.get_fields().iteritems():
-            fields[name] = factory.create(field)
-        return fields
+        return LazyFields(factory, self._schema.fields,
+                          self._schema.fieldnames)
 
     @property
     def pages(self):
-        return self._config.get_pages()
+        return list(self._schema.pages)
 
     def has_errors(self):
         """Returns True if one of the fields in the form has errors"""
-        for field in self.fields.values():
+        for field in self.fields.get_created():
             if len(field.errors) > 0:
                 return True
         return len(self.errors) != 0
 
     def has_warnings(self):
         """Returns True if one of the fields in the form has warnings"""
-        for field in self.fields.values():
+        for field in self.fields.get_created():
             if len(field.warnings) > 0:
                 return True
         return len(self.warnings) != 0
@@ -407,10 +477,10 @@ class Form(object):
         :returns: Dictionary with errors
         """
         if page is not None:
-            fields_on_page = self._config.get_fields(page)
+            fields_on_page = self._schema.get_page_fieldnames(page)
 
         errors = {}
-        for field in self.fields.values():
+        for field in self.fields.get_created():
             if page is not None and field.name not in fields_on_page:
                 continue
             if len(field.errors) > 0:
@@ -431,10 +501,10 @@ class Form(object):
         :returns: Dictionary with warnings
         """
         if page is not None:
-            fields_on_page = self._config.get_fields(page)
+            fields_on_page = self._schema.get_page_fieldnames(page)
 
         warnings = {}
-        for field in self.fields.values():
+        for field in self.fields.get_created():
             if page is not None and field.name not in fields_on_page:
                 continue
             if len(field.warnings) > 0:
@@ -450,7 +520,7 @@ class Form(object):
         return self.external_validators.append(validator)
 
     def render(self, values=None, page=0, buttons=True,
-               previous_values=None, outline=True):
+               previous_values=None, outline=True, only_page=False):
         """Returns the rendererd form as an HTML string.
 
         :values: Dictionary with values to be prefilled/overwritten in
@@ -461,14 +531,72 @@ class Form(object):
                           in readonly mode.
         :outline: Boolean flag to indicate that the outline for pages
                   should be rendered. Defaults to true.
+        :only_page: Boolean flag to indicate that only the page given
+                    in `page` (or the first page) should be rendered.
+                    The content of the other pages is loaded on demand
+                    from the `page_url` of the form. Defaults to false.
         :returns: Rendered form.
 
         """
+        self.current_page = page
+        self._prepare_render(values, previous_values)
+        renderer = FormRenderer(self, self._translate)
+        form = renderer.render(buttons=buttons, outline=outline,
+                               only_page=only_page)
+        return form
+
+    def render_iter(self, values=None, page=0, buttons=True,
+                    previous_values=None, outline=True, only_page=False):
+        """Returns a generator which yields the rendered form in parts
+        as HTML strings. Every page of the form (or every element on the
+        top level of forms without pages) is a part of its own, so the
+        form can be streamed to the client e.g as the `app_iter` of a
+        WSGI response. Joining the parts gives the same form as
+        :func:`render`. For the arguments see :func:`render`.
+
+        As the parts are rendered when they are requested from the
+        generator, the item and the dbsession of the form must be
+        available until the generator is exhausted.
+
+        :returns: Generator of rendered parts of the form.
+
+        """
+        self.current_page = page
+        self._prepare_render(values, previous_values)
+        renderer = FormRenderer(self, self._translate)
+        return renderer.render_iter(buttons=buttons, outline=outline,
+                                    only_page=only_page)
+
+    def render_page(self, page, values=None, previous_values=None):
+        """Returns the rendered content of a single page of the form as
+        an HTML string. This method can be used to implement the view
+        behind the `page_url` of the form.
+
+        :page: Number of the page. The first page has the number 1.
+        :values: Dictionary with values to be prefilled/overwritten in
+                 the rendered page.
+        :previous_values: Dictionary of values of the last saved state
+                          of the item. See :func:`render`.
+        :returns: Rendered page.
+        :raises ValueError: If the form has no page with the given
+                            number.
+
+        """
+        if not 1 <= page <= len(self.pages):
+            raise ValueError("Page %s is not in the range 1 to %s"
+                             % (page, len(self.pages)))
+        self.current_page = page
+        self._prepare_render(values, previous_values)
+        renderer = FormRenderer(self, self._translate)
+        return renderer.render_page(self.pages[page - 1])
+
+    def _prepare_render(self, values=None, previous_values=None):
+        """Sets the current and previous values of the fields before
+        rendering."""
         if not values:
             values = {}
         if not previous_values:
             previous_values = {}
-        self.current_page = page
 
         # Merge the items_values with the extra provided values. Extra
         # values will overwrite the item_values.
@@ -498,17 +626,15 @@ class Form(object):
         else:
             self._set_current_field_data(self.merged_data)
         self._set_previous_field_data(previous_values)
-        # Add csrf_token to the values dictionary
-        values['csrf_token'] = self._csrf_token
-
-        renderer = FormRenderer(self, self._translate)
-        form = renderer.render(buttons=buttons, outline=outline)
-        return form
+        # Filters of the options may depend on the values set above.
+        for field in self.fields.get_created():
+            if isinstance(field, CollectionField):
+                field.clear_options()
 
     def prefill_form_private_fields(self):
-        for name, field in self.fields.items():
+        for name in self.fields:
             if name.startswith("_"):
-                field.value = self.merged_data.get(name)
+                self.fields[name].value = self.merged_data.get(name)
 
     def _add_error(self, fieldname, error):
         if fieldname is None:
@@ -576,6 +702,84 @@ class Form(object):
         # form after conditionals has be evaluated
         fields_to_check = self._config.get_fields(values=converted,
                                                   evaluate=evaluate)
+        self._validate_fields(fields_to_check, unvalidated, converted)
+        return self._finish_validation(unvalidated, converted)
+
+    def validate_incremental(self, changed, previous, evaluate=True,
+                             removed=None):
+        """Returns True if the validation succeeds else False. In
+        contrast to :func:`validate` only the fields which are affected
+        by the changed values are validated again. The result of all
+        other fields is taken from the previous validation.
+
+        A field is affected if its own value has changed, if one of its
+        rules references a changed value or if one of the conditionals
+        enclosing the field references a changed value. Only the changed
+        values are converted again. Validators configured in the form
+        are considered to depend on the value of their own field only
+        and are called for affected fields. External validators (see
+        :func:`add_validator`) are always called; their messages of the
+        previous validation are not taken over.
+
+        The submitted values are the previous submitted values updated
+        with the changed values. Values which are no longer submitted by
+        the client (e.g. of unchecked checkboxes) can not be detected by
+        their absence in `changed` and must be given in `removed`.
+
+        :changed: Dictionary with the changed submitted values.
+        :previous: :class:`ValidationResult` of the previous validation
+        of the same form. See :attr:`result`.
+        :removed: Iterable with the names of fields whose values have
+        been removed.
+        :returns: True or False
+
+        """
+        try:
+            changed = changed.mixed()
+        except AttributeError:
+            pass
+        changed = self._filter_values(remove_ws(changed))
+        removed = set(name for name in removed or ()
+                      if name in previous.submitted and name not in changed)
+        unvalidated = dict(previous.submitted)
+        unvalidated.update(changed)
+        for fieldname in removed:
+            del unvalidated[fieldname]
+        log.debug("Submitted data: %s" % unvalidated)
+        self.submitted_data = unvalidated
+
+        dirty = dict((fieldname, value)
+                     for fieldname, value in changed.iteritems()
+                     if fieldname not in previous.submitted
+                     or previous.submitted[fieldname] != value)
+        affected = self._schema.get_affected_fieldnames(
+            set(dirty) | removed)
+        converted = dict((fieldname, value)
+                         for fieldname, value in previous.converted.iteritems()
+                         if fieldname not in dirty and fieldname not in removed)
+        converted.update(self.deserialize(dirty))
+
+        # Take over the errors and warnings of all unaffected fields
+        # without the messages of the external validators which are
+        # called again.
+        for fieldname, errors in previous.field_errors.iteritems():
+            if fieldname and fieldname not in affected:
+                self._add_error(fieldname, list(errors))
+        for fieldname, warnings in previous.field_warnings.iteritems():
+            if fieldname and fieldname not in affected:
+                self._add_warning(fieldname, list(warnings))
+
+        fields_to_check = self._config.get_fields(values=converted,
+                                                  evaluate=evaluate)
+        fields_to_check = dict((fieldname, field)
+                               for fieldname, field
+                               in fields_to_check.iteritems()
+                               if fieldname in affected)
+        self._validate_fields(fields_to_check, unvalidated, converted)
+        return self._finish_validation(unvalidated, converted)
+
+    def _validate_fields(self, fields_to_check, unvalidated, converted):
+        """Checks the rules and validators of the given fields."""
         for fieldname, field in fields_to_check.iteritems():
             field = self.fields[fieldname]
             for rule in field.get_rules():
@@ -592,18 +796,30 @@ class Form(object):
                     else:
                         self._add_error(fieldname, rule.msg)
 
-            for src, msg in field.get_validators():
-                src = src.split(".")
-                checker = getattr(importlib.import_module(".".join(src[0:-1])),
-                                  src[-1])
-                validator = Validator(fieldname, msg, checker, self)
+            for validator in self._get_configured_validators(fieldname):
                 if not validator.check(converted):
                     if validator._triggers == "error":
                         self._add_error(validator._field, validator._error)
                     else:
                         self._add_warning(validator._field, validator._error)
 
-        # Custom validation. User defined external validators.
+    def _get_configured_validators(self, fieldname):
+        """Returns a list of :class:`Validator` instances for the
+        validators configured for the field with the given name. The
+        callables are imported only once per form."""
+        validators = self._configured_validators.get(fieldname)
+        if validators is None:
+            validators = []
+            for src, msg in self._schema.validators[fieldname]:
+                src = src.split(".")
+                checker = getattr(importlib.import_module(".".join(src[0:-1])),
+                                  src[-1])
+                validators.append(Validator(fieldname, msg, checker, self))
+            self._configured_validators[fieldname] = validators
+        return validators
+
+    def _validate_external(self, converted):
+        """Calls the user defined external validators."""
         for validator in self.external_validators:
             if (validator._field not in converted
                 and validator._field is not None):
@@ -615,12 +831,23 @@ class Form(object):
                 else:
                     self._add_warning(validator._field, validator._error)
 
+    def _finish_validation(self, unvalidated, converted):
+        # The messages of the external validators are not part of the
+        # field results, so an incremental validation does not take
+        # them over.
+        field_errors = _copy_messages(self.get_errors())
+        field_warnings = _copy_messages(self.get_warnings())
+        self._validate_external(converted)
         # If the form is valid. Save the converted and validated data
         # into the data dictionary.
         has_errors = self.has_errors()
         self.converted = converted
         if not has_errors:
             self.data = converted
+        self.result = ValidationResult(unvalidated, converted,
+                                       self.get_errors(),
+                                       self.get_warnings(),
+                                       field_errors, field_warnings)
         self.validated = True
         return not has_errors
 
@@ -1,52 +1,230 @@
 import os
+import re
+import hashlib
+import logging
 from dateutil import tz
 from formbar import static_dir
 
-def get_css_files():
-    files = ['css/datepicker3.css',
+log = logging.getLogger(__name__)
+
+CSS_FILES = ['css/datepicker3.css',
              'css/bootstrap-datetimepicker.min.css',
              'css/formbar.css']
-    css = []
-    values = {}
+JS_FILES = ['js/bootstrap-datepicker.js',
+            'js/locales/bootstrap-datepicker.de.js',
+            'js/bootstrap-datetimepicker.js',
+            'js/formbar.js']
+# The ace editor is only needed for the formbareditor renderer.
+EDITOR_FILES = ['js/ace/ace.js',
+                'js/ace/ext-language_tools.js', 'js/ace/mode-xml.js',
+                'js/ace/snippets/xml.js', 'js/ace/snippets/text.js']
+# The ace editor is distributed minified already.
+MINIFIED_DIRS = ['js/ace/']
+
+_css_tokens = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')'
+                         r'|/\*.*?\*/|\s+', re.DOTALL)
+_css_punctuation = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(css):
+    """Returns the given CSS without comments and needless whitespace.
+    Strings are kept as they are.
+
+    :css: String with css
+    :returns: String with minified css
+    """
+    out = []
+    plain = []
+    last = 0
+    for match in _css_tokens.finditer(css):
+        plain.append(css[last:match.start()])
+        last = match.end()
+        if match.group(1):
+            out.append(_css_punctuation.sub(r"\1", "".join(plain)))
+            out.append(match.group(1))
+            plain = []
+        elif not match.group(0).startswith("/*"):
+            plain.append(" ")
+    plain.append(css[last:])
+    out.append(_css_punctuation.sub(r"\1", "".join(plain)))
+    return "".join(out).strip()
+
+
+def minify_js(js):
+    """Returns the given JS without indention, empty lines and lines
+    only containing a comment. Line breaks are kept as they might
+    terminate a statement, so the result is valid as long as the source
+    has no strings spanning multiple lines.
+
+    :js: String with js
+    :returns: String with minified js
+    """
+    lines = []
+    for line in js.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class Bundle(object):
+    """Concatenated (and minified) content of static files. The content
+    is read only once and is identified by the hash of the content which
+    can be used as ETag and as part of the URL of the bundle to allow
+    far future caching in the browser."""
+
+    def __init__(self, name, files, minify=True):
+        """
+        :name: Name of the bundle. Used in the filename.
+        :files: List of files relative to the static directory
+        :minify: If True, the content is minified. Files with ".min." in
+            the name or in one of the MINIFIED_DIRS are already minified
+            and are not changed.
+        """
+        self.name = name
+        self.files = files
+        self.minify = minify
+        self.extension = os.path.splitext(files[0])[1]
+        self._content = None
+        self._hash = None
+
+    def _build(self):
+        if self.extension == ".css":
+            minify, separator = minify_css, "\n"
+        else:
+            # The separator terminates the last statement of a file
+            # without a semicolon.
+            minify, separator = minify_js, "\n;\n"
+        out = []
+        for filename in self.files:
+            filepath = os.path.join(static_dir, filename)
+            with open(filepath, 'r') as f:
+                content = f.read()
+            if (self.minify and ".min." not in filename and not
+               any(filename.startswith(d) for d in MINIFIED_DIRS)):
+                content = minify(content)
+            out.append(content)
+        content = separator.join(out)
+        log.debug("Built bundle %s (%s bytes)" % (self.name, len(content)))
+        self._hash = hashlib.sha1(content).hexdigest()
+        self._content = content
+
+    @property
+    def content(self):
+        """String with the content of the bundle"""
+        if self._content is None:
+            self._build()
+        return self._content
+
+    @property
+    def hash(self):
+        """Hexdigest of the SHA1 hash of the content"""
+        if self._hash is None:
+            self._build()
+        return self._hash
+
+    @property
+    def etag(self):
+        """Quoted value for the ETag header"""
+        return '"%s"' % self.hash
+
+    @property
+    def filename(self):
+        """Filename of the bundle including the first characters of
+        the hash (e.g formbar.3f2a9c1d7e5b.js)"""
+        return "%s.%s%s" % (self.name, self.hash[:12], self.extension)
+
+    @property
+    def content_type(self):
+        """Mimetype of the content"""
+        if self.extension == ".css":
+            return "text/css"
+        return "application/javascript"
+
+
+_bundles = {}
+
+
+def get_bundle(name, minify=True):
+    """Returns the :class:`Bundle` with the given name. Available
+    bundles are "css" (all CSS), "js" (formbar.js and the datepickers),
+    "editor" (the ace editor for the formbareditor renderer) and "all"
+    (the files of "js" and "editor"). The bundles are built once and
+    cached in memory.
+
+    :name: Name of the bundle
+    :minify: If True, the content of the bundle is minified
+    :returns: :class:`Bundle`
+    """
+    key = (name, minify)
+    if key not in _bundles:
+        if name == "css":
+            files = CSS_FILES
+        elif name == "js":
+            files = JS_FILES
+        elif name == "editor":
+            files = EDITOR_FILES
+        elif name == "all":
+            files = JS_FILES + EDITOR_FILES
+        else:
+            raise KeyError("Unknown bundle %s" % name)
+        _bundles[key] = Bundle("formbar-%s" % name, files, minify)
+    return _bundles[key]
+
+
+def uses_editor(form):
+    """Returns True if one of the fields of the given form is rendered
+    with the formbareditor renderer and the "editor" bundle is needed.
+
+    :form: :class:`.Form`
+    :returns: True or False
+    """
+    # The renderers are taken from the schema as iterating over the
+    # fields would create all fields of the form.
+    for renderer in form._schema.renderers.values():
+        if renderer is not None and renderer.render_type == "formbareditor":
+            return True
+    return False
+
+
+def _read_files(files):
+    out = []
     for filename in files:
         filepath = os.path.join(static_dir, filename)
         with open(filepath, 'r') as f:
             content = f.read()
-        css.append((filename, content))
-    return css
+        out.append((filename, content))
+    return out
+
+
+def get_css_files():
+    return _read_files(CSS_FILES)
+
 
 def get_js_files():
-    files = ['js/bootstrap-datepicker.js',
-             'js/locales/bootstrap-datepicker.de.js',
-             'js/bootstrap-datetimepicker.js',
-             'js/formbar.js', 'js/ace/ace.js',
-             'js/ace/ext-language_tools.js', 'js/ace/mode-xml.js',
-             'js/ace/snippets/xml.js', 'js/ace/snippets/text.js']
-    js = []
-    for filename in files:
-        filepath = os.path.join(static_dir, filename)
-        with open(filepath, 'r') as f:
-            content = f.read()
-        js.append((filename, content))
-    return js
+    return _read_files(JS_FILES + EDITOR_FILES)
+
 
 def get_css():
-    """Returns the content of the formbar CSS file
+    """Returns the content of the formbar CSS file. The content is
+    minified and cached, see :func:`get_bundle`.
+
     :returns: String with css
     """
-    out = []
-    for filename, content in get_css_files():
-        out.append(content)
-    return "".join(out)
+    return get_bundle("css").content
 
-def get_js():
-    """Returns the content of the formbar JS file
+
+def get_js(editor=True):
+    """Returns the content of the formbar JS file. The content is
+    minified and cached, see :func:`get_bundle`.
+
+    :editor: If False, the ace editor is not included. It is only
+        needed for the formbareditor renderer.
     :returns: String with js
     """
-    out = []
-    for filename, content in get_js_files():
-        out.append(content)
-    return "".join(out)
+    if editor:
+        return get_bundle("all").content
+    return get_bundle("js").content
 
 
 def get_local_datetime(dt, timezone=None):
@@ -1,11 +1,15 @@
 import logging
+import os
+import json
 import difflib
+import threading
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
 from webhelpers.html import literal, HTML
 
 from mako.lookup import TemplateLookup
 from formbar import template_dir
-from formbar.rules import Rule
+from formbar.rules import Rule, get_client_tree, get_variables
 from formbar.fields import (
         TimedeltaField, ManytooneRelationField,
         ManytomanyRelationField, OnetomanyRelationField, EmailField,
@@ -19,6 +23,92 @@ template_lookup = TemplateLookup(directories=[template_dir],
 
 log = logging.getLogger(__name__)
 
+_templates = {}
+_templates_lock = threading.Lock()
+# JSON of the client trees of the expressions of conditionals. The
+# expressions are taken from the form configurations, so the number of
+# entries is bounded.
+_client_trees = {}
+
+
+def get_client_tree_json(expression):
+    """Returns the JSON of the tokens of the given expression which are
+    evaluated in the browser by formbar.js or an empty string if the
+    expression must be evaluated on the server. See
+    :func:`.rules.get_client_tree`.
+
+    :expression: String representation of the expression
+    :returns: JSON string
+    """
+    try:
+        return _client_trees[expression]
+    except KeyError:
+        tree = get_client_tree(expression)
+        result = _client_trees[expression] = (
+            json.dumps(tree) if tree is not None else "")
+        return result
+
+
+def configure_templates(module_directory=None, filesystem_checks=True):
+    """Configures the lookup of the templates of the renderers. Call
+    this once on startup of the application before rendering any form.
+
+    :module_directory: Directory where the compiled templates are
+    stored. If set the templates are compiled only once and reused by
+    all processes and after restarts of the application. Defaults to
+    compile the templates in memory in every process.
+    :filesystem_checks: If True the compiled templates are compiled
+    again if the template file changes. Set it to False in production
+    to look up every template only once per process.
+    """
+    global template_lookup
+    with _templates_lock:
+        template_lookup = TemplateLookup(directories=[template_dir],
+                                         default_filters=['h'],
+                                         module_directory=module_directory,
+                                         filesystem_checks=filesystem_checks)
+        _templates.clear()
+
+
+def get_template(name):
+    """Will return the template with the given name from the
+    template_lookup. If the filesystem checks of the lookup are
+    disabled (see :func:`configure_templates`) templates are only looked
+    up on the first call and shared by all renderers afterwards.
+    Otherwise every call asks the lookup, which checks if the template
+    file has changed.
+
+    :name: Name of the template e.g "form.mako"
+    :returns: Template
+    """
+    if template_lookup.filesystem_checks:
+        return template_lookup.get_template(name)
+    template = _templates.get(name)
+    if template is None:
+        template = template_lookup.get_template(name)
+        with _templates_lock:
+            _templates[name] = template
+    return template
+
+
+def preload_templates(names=None):
+    """Will compile and load the given templates. Can be called on
+    startup of the application to avoid compiling the templates on the
+    first request. If a module_directory is configured (see
+    :func:`configure_templates`) the compiled templates are written to
+    the module_directory.
+
+    :names: List of template names. Defaults to all templates of
+    formbar.
+    :returns: List of the loaded template names
+    """
+    if names is None:
+        names = sorted(name for name in os.listdir(template_dir)
+                       if name.endswith(".mako"))
+    for name in names:
+        get_template(name)
+    return names
+
 
 def get_field_type(field):
     """Helper method to get the lowercase string version of the type of te
@@ -74,6 +164,8 @@ def get_renderer(field, translate):
             return FormbarEditorRenderer(field, translate)
         elif renderer.render_type == "currency":
             return CurrencyFieldRenderer(field, translate)
+        elif renderer.render_type == "remoteselection":
+            return RemoteSelectionFieldRenderer(field, translate)
     else:
         # Try to determine the datatype of the field and set approriate
         # renderer.
@@ -100,6 +192,179 @@ def get_renderer(field, translate):
     return TextFieldRenderer(field, translate)
 
 
+def _freeze(value):
+    """Returns a hashable version of the given serialized value."""
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return unicode(value)
+
+
+class LRUCache(object):
+    """Dictionary like in-memory cache which holds at most `maxsize`
+    items. If the cache is full the least recently used item is
+    removed. This is the default backend of the :class:`FragmentCache`."""
+
+    def __init__(self, maxsize=1000):
+        """
+        :maxsize: Maximum number of items in the cache.
+        """
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is None:
+                return default
+            # Reinsert to mark the item as recently used.
+            self._items[key] = value
+            return value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class FragmentCache(object):
+    """Cache for rendered HTML fragments of readonly fields and pages.
+    The fragments are keyed by the digest of the configuration the form
+    is taken from, the id of the form, the name of the field
+    (or the id of the page), the serialized values, the locale, the
+    timezone and the translation domain. The cache is used if it is
+    provided with the `fragment_cache` parameter on form
+    initialisation.
+
+    The fragments are stored in a backend. Any dictionary like object
+    which supports `get` and item assignment can be used as backend.
+    Keys are tuples and values are unicode strings. If no backend is
+    given a :class:`LRUCache` is used.
+
+    Note that the options of selection fields are not part of the key.
+    Clear the cache if the options change."""
+
+    def __init__(self, backend=None, maxsize=1000, domain=None):
+        """
+        :backend: Dictionary like object to store the fragments.
+        :maxsize: Size of the default :class:`LRUCache` backend.
+        :domain: Translation domain. Part of the key to separate the
+        fragments of different translations using the same backend.
+        """
+        if backend is None:
+            backend = LRUCache(maxsize)
+        self.backend = backend
+        self.domain = domain
+        self.hits = 0
+        """Number of fragments taken from the cache."""
+        self.misses = 0
+        """Number of rendered fragments."""
+
+    def get_key(self, form, *parts):
+        """Returns the key for a fragment of the given form.
+
+        :form: :class:`.Form` instance
+        :parts: Further parts of the key identifying the fragment.
+        :returns: Tuple
+        """
+        # Form ids like "update" are used in many configurations, so the
+        # key includes the configuration. A changed and reloaded
+        # configuration gets new keys as well.
+        config = form._config
+        return ((config._parent.digest, config.id, form._locale,
+                 form._timezone, self.domain) + parts)
+
+    def render(self, key, render):
+        """Returns the fragment for the given key. If the fragment is
+        not in the cache it is rendered by calling `render` and stored.
+
+        :key: Key of the fragment
+        :render: Callable which returns the rendered fragment.
+        :returns: Rendered fragment
+        """
+        html = self.backend.get(key)
+        if html is None:
+            self.misses += 1
+            html = unicode(render())
+            self.backend[key] = html
+        else:
+            self.hits += 1
+        return literal(html)
+
+    def clear(self):
+        """Removes all fragments from the backend."""
+        self.backend.clear()
+
+
+class ClientManifest(object):
+    """Collects the fields and conditionals while a form or a page is
+    rendered. The collected data is rendered as JSON in a script element
+    of the form and is used by formbar.js to initialise the form without
+    scanning the DOM and parsing the attributes of the rendered
+    elements."""
+
+    def __init__(self):
+        self.fields = OrderedDict()
+        """Client data of the rendered form groups by fieldname"""
+        self.conditionals = OrderedDict()
+        """Client data of the rendered conditionals by id"""
+
+    def add_field(self, field, active):
+        """Adds the form group of the given field if its renderer
+        renders a form group.
+
+        :field: Rendered field
+        :active: True if the field is in an active conditional
+        """
+        if not field.renderer.formgroup:
+            return
+        self.fields[field.name] = {
+            "state": "active" if active else "inactive",
+            "desired": u"%s" % field.desired,
+            "required": u"%s" % field.required,
+            "rules": [{"expr": rule._expression, "type": rule.triggers}
+                      for rule in field.get_rules()]
+        }
+
+    def add_conditional(self, elem):
+        """Adds the given conditional.
+
+        :elem: Element of the conditional in the form configuration
+        """
+        expr = elem.attrib.get("expr")
+        self.conditionals[str(id(elem))] = {"expr": expr,
+                                            "ast": get_client_tree(expr),
+                                            "fields": get_variables(expr)}
+
+    def render(self):
+        """Returns the script element with the manifest as JSON."""
+        data = json.dumps({"fields": self.fields,
+                           "conditionals": self.conditionals},
+                          separators=(",", ":"))
+        # Make sure the JSON does not close the script element.
+        data = data.replace("<", "\\u003c")
+        return HTML.tag("script", type="application/json",
+                        class_="formbar-manifest", c=literal(data))
+
+
 class Renderer(object):
     """Basic renderer to render Form objects."""
 
@@ -128,26 +393,59 @@ class FormRenderer(Renderer):
 
         self._form = form
         self.translate = translate
-        self.template = template_lookup.get_template("form.mako")
+        self.template = get_template("form.mako")
 
-    def render(self, buttons=True, outline=True):
+    def render(self, buttons=True, outline=True, only_page=False):
         """Returns the rendered form as string.
 
         :buttons: Boolean flag to indicate if the form buttons should be
         rendererd. Defaults to true.
         :outline: Boolean flag to indicate that the outline for pages
         should be rendered. Defaults to true.
+        :only_page: Boolean flag to indicate that only the currently
+        selected page should be rendered. Other pages are loaded on
+        demand. Defaults to false.
         :returns: rendered form.
 
         """
         html = []
+        manifest = ClientManifest()
         html.append(self._render_form_start())
-        html.append(self._render_form_body(outline))
+        html.append(self._render_form_body(outline, only_page, manifest))
         if not self._form._config.readonly and buttons:
             html.append(self._render_form_buttons())
+        html.append(manifest.render())
         html.append(self._render_form_end())
         return literal("").join(html)
 
+    def render_iter(self, buttons=True, outline=True, only_page=False):
+        """Generator which yields the rendered form in parts. Every page
+        of the form (or every element on the top level of forms without
+        pages) is rendered and yielded on its own, so the form can be
+        streamed to the client while the next part is rendered. Joining
+        the parts gives the same form as :func:`render`. For the
+        arguments see :func:`render`."""
+        yield self._render_form_start()
+        manifest = ClientManifest()
+        values = self._get_template_values(outline, only_page, manifest)
+        paged = outline and len(self._form.pages) > 0
+
+        def render_def(name, *args):
+            return literal(self.template.get_def(name).render(*args,
+                                                              **values))
+        yield render_def("render_body_start", paged)
+        if paged:
+            for num, page in enumerate(self._form.pages):
+                yield render_def("render_page_container", num, page)
+        else:
+            tree = self._form._config._tree
+            for child in tree:
+                yield render_def("render_recursive", tree, '', True, [child])
+        yield render_def("render_body_end", paged)
+        if not self._form._config.readonly and buttons:
+            yield self._render_form_buttons()
+        yield manifest.render() + self._render_form_end()
+
     def _render_form_start(self):
         html = []
         html.append(HTML.tag("div", class_="formbar-form", _closed=False))
@@ -160,7 +458,8 @@ class FormRenderer(Renderer):
                              method=self._form._config.method,
                              autocomplete=self._form._config.autocomplete,
                              enctype=self._form._config.enctype,
-                             evalurl=self._form._eval_url or ""))
+                             evalurl=self._form._eval_url or "",
+                             pageurl=self._form._page_url or None))
         # Add hidden field with csrf_token if this is not None.
         if self._form._csrf_token:
             html.append(HTML.tag("input",
@@ -169,14 +468,61 @@ class FormRenderer(Renderer):
                                  value=self._form._csrf_token))
         return literal("").join(html)
 
-    def _render_form_body(self, render_outline):
-        values = {'form': self._form,
-                  '_': self.translate,
-                  'render_outline': render_outline,
-                  'ElementTree': ET,
-                  'Rule': Rule}
+    def _get_template_values(self, render_outline, only_page=False,
+                             manifest=None):
+        # Names of the fields which are already rendered. Used to render
+        # the values of fields on not loaded pages only once.
+        rendered = set()
+        if only_page and self._form.pages:
+            page = self._form.pages[max(self._form.current_page, 1) - 1]
+            rendered.update(self._form._schema.get_page_fieldnames(page))
+        return {'form': self._form,
+                '_': self.translate,
+                'render_outline': render_outline,
+                'only_page': only_page,
+                'rendered': rendered,
+                'get_field_type': get_field_type,
+                'ElementTree': ET,
+                'Rule': Rule,
+                'get_client_tree_json': get_client_tree_json,
+                'manifest': manifest or ClientManifest()}
+
+    def _render_form_body(self, render_outline, only_page=False,
+                          manifest=None):
+        values = self._get_template_values(render_outline, only_page,
+                                           manifest)
         return literal(self.template.render(**values))
 
+    def render_page(self, page):
+        """Returns the rendered content of the given page as string. The
+        page is rendered the same way as in the whole form. Pages of
+        readonly forms are taken from the fragment cache of the form if
+        available.
+
+        :page: Page element of the form configuration.
+        :returns: rendered page.
+
+        """
+        manifest = ClientManifest()
+        values = self._get_template_values(True, manifest=manifest)
+
+        def render():
+            html = self.template.get_def("render_page").render(page,
+                                                               **values)
+            return literal(html) + manifest.render()
+
+        form = self._form
+        cache = form._fragment_cache
+        if (cache is None or not form._config.readonly
+           or form.has_errors() or form.has_warnings()):
+            return literal(render())
+        # The page may contain conditionals depending on the value of
+        # any field so the values of all fields are part of the key.
+        fieldvalues = tuple((name, _freeze(form.get_field(name).get_value()))
+                            for name in form._schema.fieldnames)
+        key = cache.get_key(form, "page", page.attrib.get("id"), fieldvalues)
+        return cache.render(key, render)
+
     def _render_form_buttons(self):
         # Render default buttons if no buttons have been defined for the
         # form.
@@ -244,6 +590,16 @@ class FieldRenderer(Renderer):
     """Renderer for fields. The renderer will build the the HTML for the
     provided field."""
 
+    @property
+    def formgroup(self):
+        """True if the renderer renders a form group of the field. Only
+        fields with form groups are initialised on the client. Defaults
+        to True if the renderer uses :func:`render` of this class.
+        Renderers which overwrite :func:`render` and still render a form
+        group must overwrite the property with a class attribute
+        ``formgroup = True``."""
+        return self.render.__func__ is FieldRenderer.render.__func__
+
     def __init__(self, field, translate):
         """Initialize the Renderer with the field instance.
 
@@ -264,20 +620,20 @@ class FieldRenderer(Renderer):
         return getattr(self._config, name)
 
     def _render_label(self):
-        template = template_lookup.get_template("label.mako")
+        template = get_template("label.mako")
         values = {'field': self._field,
                   '_': self.translate}
         return literal(template.render(**values))
 
     def _render_errors(self):
-        template = template_lookup.get_template("errors.mako")
+        template = get_template("errors.mako")
         values = {'field': self._field,
                   '_': self.translate,
                   'active': self._active}
         return literal(template.render(**values))
 
     def _render_help(self):
-        template = template_lookup.get_template("help.mako")
+        template = get_template("help.mako")
         values = {'field': self._field,
                   '_': self.translate}
         return literal(template.render(**values))
@@ -339,6 +695,15 @@ class FieldRenderer(Renderer):
             out.append(HTML.tag("/span", _closed=False))
         return literal("").join(out)
 
+    def get_cache_key(self, cache):
+        """Returns the key of the rendered field for the given
+        :class:`FragmentCache`."""
+        field = self._field
+        return cache.get_key(field._form, "field", field.name,
+                             self.__class__.__name__, self._active,
+                             _freeze(field.get_value()),
+                             _freeze(field.get_previous_value()))
+
     def _get_template_values(self):
         values = {'field': self._field,
                   'renderer': self,
@@ -347,76 +712,24 @@ class FieldRenderer(Renderer):
         return values
 
     def render(self):
-        # TODO: Split rendering in four parts: label, fieldbody, errors,
-        # help. Each in its own template.
-        html = []
-        has_errors = len(self._field.errors)
-        has_warnings = len(self._field.warnings)
-        active = 'active' if self._active else 'inactive'
+        """Returns the complete form group of the field including the
+        label, errors and help. The form group is rendered in a single
+        pass of the formgroup.mako template which renders the template
+        of the renderer in the same context."""
         # Handle indent. Set indent_with css only if the elements are
         # actually have an indent and the lable position allows an
         # indent.
-        indent_width = ""
+        indent_padding = 0
         if self.elements_indent \
            and self.label_position not in ["left", "right"]:
-            indent_width = self.indent_width
-        class_options = ((has_errors and 'has-error'),
-                         (has_warnings and 'has-warning'),
-                         (active))
-        html.append(HTML.tag("div", _closed=False,
-                    rules=u"{}".format(";".join(rules_to_string(self._field))),
-                    formgroup="{}".format(self._field.name),
-                    desired="{}".format(self._field.desired),
-                    required="{}".format(self._field.required),
-                    class_=("form-group %s %s %s" % class_options)))
+            indent_padding = {"indent-sm": 36,
+                              "indent-md": 56,
+                              "indent-lg": 76}.get(self.indent_width, 0)
         values = self._get_template_values()
-        if self.label_width > 0 and self.label_position in ["left", "right"]:
-            label_width = self.label_width
-            label_align = self.label_align
-            field_width = 12 - self.label_width
-            html.append(HTML.tag("div", _closed=False, class_="row"))
-            if self.label_position == "left":
-                html.append(HTML.tag("div", _closed=False,
-                                     class_=("col-sm-%s" % label_width),
-                                     align=("%s" % label_align)))
-                html.append(self._render_label())
-                html.append(HTML.tag("/div", _closed=False))
-                html.append(HTML.tag("div", _closed=False,
-                                     class_=("col-sm-%s" % field_width)))
-                html.append(literal(self.template.render(**values)))
-                html.append(self._render_errors())
-                html.append(self._render_help())
-                html.append(HTML.tag("/div", _closed=False))
-            else:
-                html.append(HTML.tag("div", _closed=False,
-                                     class_=("col-sm-%s" % field_width)))
-                html.append(literal(self.template.render(**values)))
-                html.append(self._render_errors())
-                html.append(self._render_help())
-                html.append(HTML.tag("/div", _closed=False))
-                html.append(HTML.tag("div", _closed=False,
-                                     class_=("col-sm-%s" % label_width),
-                                     align=("%s" % label_align)))
-                html.append(self._render_label())
-                html.append(HTML.tag("/div", _closed=False))
-            html.append(HTML.tag("/div", _closed=False))
-        else:
-            html.append(self._render_label())
-            if indent_width == "indent-sm":
-                indent_padding = 36
-            elif indent_width == "indent-md":
-                indent_padding = 56
-            elif indent_width == "indent-lg":
-                indent_padding = 76
-            else:
-                indent_padding = 0
-            html.append(HTML.tag("div", _closed=False, style="padding-left: {}px".format(indent_padding)))
-            html.append(literal(self.template.render(**values)))
-            html.append(HTML.tag("/div", _closed=False))
-            html.append(self._render_errors())
-            html.append(self._render_help())
-        html.append(HTML.tag("/div", _closed=False))
-        return literal("").join(html)
+        values['active'] = self._active
+        values['indent_padding'] = indent_padding
+        values['rules'] = rules_to_string(self._field)
+        return literal(get_template("formgroup.mako").render(**values))
 
 
 class InfoFieldRenderer(FieldRenderer):
@@ -424,7 +737,7 @@ class InfoFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("infofield.mako")
+        self.template = get_template("infofield.mako")
 
 
 class TextFieldRenderer(FieldRenderer):
@@ -432,7 +745,7 @@ class TextFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("textfield.mako")
+        self.template = get_template("textfield.mako")
 
 
 class TimeFieldRenderer(FieldRenderer):
@@ -440,7 +753,7 @@ class TimeFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("timefield.mako")
+        self.template = get_template("timefield.mako")
 
 
 class CurrencyFieldRenderer(FieldRenderer):
@@ -448,7 +761,7 @@ class CurrencyFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("currency.mako")
+        self.template = get_template("currency.mako")
 
 
 class EmailFieldRenderer(FieldRenderer):
@@ -456,7 +769,7 @@ class EmailFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("email.mako")
+        self.template = get_template("email.mako")
 
 
 class FileFieldRenderer(FieldRenderer):
@@ -464,7 +777,7 @@ class FileFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("filefield.mako")
+        self.template = get_template("filefield.mako")
 
 
 class TextareaFieldRenderer(FieldRenderer):
@@ -472,7 +785,7 @@ class TextareaFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("textarea.mako")
+        self.template = get_template("textarea.mako")
 
     def nl2br(self, value=""):
         return literal("<br />".join(value.split("\n")))
@@ -483,7 +796,7 @@ class DateFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("datefield.mako")
+        self.template = get_template("datefield.mako")
 
 
 class DatetimeFieldRenderer(FieldRenderer):
@@ -491,7 +804,7 @@ class DatetimeFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("datetimefield.mako")
+        self.template = get_template("datetimefield.mako")
 
 
 class PasswordFieldRenderer(FieldRenderer):
@@ -499,7 +812,7 @@ class PasswordFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("password.mako")
+        self.template = get_template("password.mako")
 
 
 class HiddenFieldRenderer(FieldRenderer):
@@ -507,7 +820,7 @@ class HiddenFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("hidden.mako")
+        self.template = get_template("hidden.mako")
 
     def render(self):
         html = []
@@ -521,7 +834,7 @@ class HTMLRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("html.mako")
+        self.template = get_template("html.mako")
 
     def render(self):
         html = []
@@ -538,16 +851,10 @@ class OptionFieldRenderer(FieldRenderer):
     # implementation of the ListingFieldRenderer to see how this
     # ignoring is implemented. (ti) <2013-10-11 22:39>
 
-    def __init__(self, field, translate):
-        FieldRenderer.__init__(self, field, translate)
-        self._cache_options = None
-
     def _get_template_values(self):
         values = FieldRenderer._get_template_values(self)
         # Add the options to the values dictionary
-        if self._cache_options is None:
-            self._cache_options = self._field.get_options()
-        values['options'] = self._cache_options
+        values['options'] = self._field.get_cached_options()
         return values
 
 
@@ -556,7 +863,7 @@ class DropdownFieldRenderer(OptionFieldRenderer):
 
     def __init__(self, field, translate):
         OptionFieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("dropdown.mako")
+        self.template = get_template("dropdown.mako")
 
 
 class SelectionFieldRenderer(OptionFieldRenderer):
@@ -564,7 +871,7 @@ class SelectionFieldRenderer(OptionFieldRenderer):
 
     def __init__(self, field, translate):
         OptionFieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("selection.mako")
+        self.template = get_template("selection.mako")
 
 
 class RadioFieldRenderer(OptionFieldRenderer):
@@ -572,7 +879,7 @@ class RadioFieldRenderer(OptionFieldRenderer):
 
     def __init__(self, field, translate):
         OptionFieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("radio.mako")
+        self.template = get_template("radio.mako")
 
 
 class CheckboxFieldRenderer(OptionFieldRenderer):
@@ -580,7 +887,28 @@ class CheckboxFieldRenderer(OptionFieldRenderer):
 
     def __init__(self, field, translate):
         OptionFieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("checkbox.mako")
+        self.template = get_template("checkbox.mako")
+
+
+class RemoteSelectionFieldRenderer(FieldRenderer):
+    """A Renderer to render a selection for relation fields with many
+    options. Only the selected options are rendered. Further options are
+    searched and loaded from the URL configured in the `url` attribute
+    of the renderer. See :func:`.RelationField.search_options`."""
+
+    def __init__(self, field, translate):
+        FieldRenderer.__init__(self, field, translate)
+        self.template = get_template("remoteselection.mako")
+
+    def get_option_url(self):
+        """Returns the URL to load the options from."""
+        return self._field._form._url_prefix + (self.url or "")
+
+    def _get_template_values(self):
+        values = FieldRenderer._get_template_values(self)
+        values['multiple'] = not isinstance(self._field,
+                                            ManytooneRelationField)
+        return values
 
 
 class TextoptionFieldRenderer(OptionFieldRenderer):
@@ -591,7 +919,7 @@ class TextoptionFieldRenderer(OptionFieldRenderer):
 
     def __init__(self, field, translate):
         OptionFieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("textoption.mako")
+        self.template = get_template("textoption.mako")
 
 
 class FormbarEditorRenderer(FieldRenderer):
@@ -600,7 +928,7 @@ class FormbarEditorRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("formbareditor.mako")
+        self.template = get_template("formbareditor.mako")
 
 # TODO: Check which of the following Renderers are needed (ti). It looks
 # like they are outdated as they are using old FormAlchemy fa_*.mako
@@ -612,4 +940,4 @@ class ListFieldRenderer(FieldRenderer):
 
     def __init__(self, field, translate):
         FieldRenderer.__init__(self, field, translate)
-        self.template = template_lookup.get_template("fa_field.mako")
+        self.template = get_template("fa_field.mako")
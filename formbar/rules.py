@@ -1,4 +1,348 @@
-from brabbel.expression import Expression
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pyparsing import ParseResults
+from brabbel.expression import Expression as BaseExpression
+from brabbel.parser import Parser
+from brabbel.operators import operators
+from brabbel.functions import functions
+
+log = logging.getLogger(__name__)
+
+
+def parse(expression):
+    """Returns the parsed tree of the given expression string or None if
+    the expression can not be parsed."""
+    tree = Parser().parse(expression)
+    # Sometimes pyparsing's caching mechanism will break down under
+    # heavy load. Parsing the expression again seems to solve the
+    # problem. See brabbel.expression.Expression.
+    for i in range(1, 6):
+        if tree is not None:
+            break
+        log.error('Parsed tree of "%s" is None! Parsing it again... '
+                  'Try %s of 5' % (expression, i))
+        tree = Parser().parse(expression)
+    return tree
+
+
+class ExpressionCache(object):
+    """Bounded LRU cache for parsed expression trees. The cache is
+    shared by all expressions and rules in the process so that every
+    distinct expression string is parsed only once as long as it stays
+    in the cache. The parsed tree only depends on the expression string
+    so mode, triggers and message of a rule are not part of the key.
+    Unicode and byte strings are cached separately as brabbel handles
+    them differently although they are equal in Python 2."""
+
+    def __init__(self, maxsize=2048):
+        """
+        :maxsize: Maximum number of cached expression trees.
+        """
+        self.maxsize = maxsize
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        """Number of trees returned from the cache."""
+        self.misses = 0
+        """Number of expressions which needed to be parsed."""
+
+    def get(self, expression):
+        """Returns the parsed tree for the given expression string.
+
+        :expression: String representation of the expression
+        :returns: Parsed tree
+        """
+        key = (type(expression), expression)
+        with self._lock:
+            tree = self._trees.pop(key, None)
+            if tree is not None:
+                # Reinsert to mark the tree as recently used.
+                self._trees[key] = tree
+                self.hits += 1
+                return tree
+            self.misses += 1
+        tree = parse(expression)
+        if tree is not None:
+            with self._lock:
+                self._trees[key] = tree
+                while len(self._trees) > self.maxsize:
+                    self._trees.popitem(last=False)
+        return tree
+
+    def clear(self):
+        """Removes all trees from the cache and resets the counters."""
+        with self._lock:
+            self._trees.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dictionary with the number of cache hits, misses,
+        the number of cached trees and the maximum size of the cache."""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._trees),
+                "maxsize": self.maxsize}
+
+
+expression_cache = ExpressionCache()
+"""Default process wide :class:`ExpressionCache`."""
+
+
+def _to_ast_atom(element):
+    if isinstance(element, basestring) and element.startswith("$"):
+        return ["var", element[1:]]
+    return ["lit", element]
+
+
+def to_ast(tree):
+    """Returns a simplified syntax tree of the given parsed brabbel
+    tree. The syntax tree is build from nested lists and can be
+    serialised as JSON. The nodes have the following form:
+
+    * ``["var", name]``: Value of the variable with the given name.
+    * ``["lit", value]``: Literal string, number, boolean or list.
+    * ``["not", node]``: Negation of the node.
+    * ``["call", name, node]``: Call of a brabbel function.
+    * ``[op, left, right]``: Binary operator like "==", "in" or "and".
+
+    Operators are combined from left to right in the same way as
+    brabbel evaluates the tree.
+
+    :tree: Parsed brabbel tree
+    :returns: Syntax tree or None if tree is None.
+    """
+    if tree is None:
+        return None
+    operand = []
+    op = None
+    func = None
+    for element in tree:
+        if func is not None:
+            node = ["call", func, _to_ast_atom(element[0])]
+            func = None
+        elif isinstance(element, ParseResults):
+            node = to_ast(element)
+        elif isinstance(element, basestring) and element in operators:
+            op = element
+            continue
+        elif isinstance(element, basestring) and element in functions:
+            func = element
+            continue
+        else:
+            node = _to_ast_atom(element)
+        operand.append(node)
+        if len(operand) == 2:
+            operand = [[op, operand[0], operand[1]]]
+            op = None
+    if op == "not":
+        return ["not", operand[0]]
+    return operand[0]
+
+
+def get_ast(expression):
+    """Returns the simplified syntax tree of the given expression string.
+    See :func:`to_ast`. The expression is parsed using the
+    :data:`expression_cache`.
+
+    :expression: String representation of the expression
+    :returns: Syntax tree or None if the expression can not be parsed.
+    """
+    return to_ast(expression_cache.get(expression))
+
+
+_variable_re = re.compile(r"\$[\w.]+")
+
+
+def get_variables(expression):
+    """Returns the names of the variables used in the given expression
+    string. The variables are found in the same way as formbar.js finds
+    the variables to substitute their values.
+
+    :expression: String representation of the expression
+    :returns: List of the variable names without the leading ``$``.
+    """
+    return [var[1:] for var in _variable_re.findall(expression)]
+
+
+# Functions which can be evaluated by the client. All other functions
+# depend on the state of the server (e.g. the current date).
+_client_functions = ("bool", "len")
+
+
+def _to_client_atom(element, resolve=True):
+    if isinstance(element, bool):
+        return ["bool", element]
+    if isinstance(element, (int, long)):
+        if abs(element) >= 2 ** 53:
+            raise ValueError("Integer can not be represented on the client")
+        return ["int", element]
+    if isinstance(element, float):
+        return ["float", element]
+    if isinstance(element, basestring):
+        if resolve and element.startswith("$"):
+            return ["var", element]
+        return ["str", element]
+    if isinstance(element, list):
+        return ["list", [_to_client_atom(e, False) for e in element]]
+    raise ValueError("Unsupported element %r" % element)
+
+
+def to_client_tree(tree):
+    """Returns the tokens of the given parsed brabbel tree in a form
+    which can be serialised as JSON and evaluated by formbar.js. In
+    contrast to :func:`to_ast` the tokens keep the grouping of the
+    parsed tree as brabbel evaluates the tokens of a group from left to
+    right and stops evaluating the group on short circuiting "and" and
+    "or" operators. The tokens have the following form:
+
+    * ``["group", tokens]``: Nested group of tokens.
+    * ``["op", name]``: Operator.
+    * ``["call", name, token]``: Call of a function with an argument.
+    * ``["var", name]``: Variable.
+    * ``["int", value]``, ``["float", value]``, ``["str", value]``,
+      ``["bool", value]``, ``["list", tokens]``: Literal values.
+
+    :tree: Parsed brabbel tree
+    :returns: List of tokens.
+    :raises: ValueError if the tree can not be evaluated by the client.
+    """
+    tokens = []
+    func = None
+    for element in tree:
+        if func is not None:
+            if not isinstance(element, ParseResults) or len(element) == 0:
+                raise ValueError("Missing argument of %s" % func)
+            tokens.append(["call", func, _to_client_atom(element[0])])
+            func = None
+        elif isinstance(element, ParseResults):
+            tokens.append(["group", to_client_tree(element)])
+        elif isinstance(element, basestring) and element in operators:
+            tokens.append(["op", element])
+        elif isinstance(element, basestring) and element in functions:
+            if element not in _client_functions:
+                raise ValueError("Function %s is not supported" % element)
+            func = element
+        else:
+            tokens.append(_to_client_atom(element))
+    if func is not None:
+        raise ValueError("Missing argument of %s" % func)
+    return tokens
+
+
+def get_client_tree(expression):
+    """Returns the tokens of the given expression string which can be
+    evaluated by the client or None if the expression must be evaluated
+    on the server. See :func:`to_client_tree`. The expression is parsed
+    using the :data:`expression_cache`.
+
+    :expression: String representation of the expression
+    :returns: List of tokens or None.
+    """
+    tree = expression_cache.get(expression)
+    if tree is None:
+        return None
+    try:
+        return to_client_tree(tree)
+    except ValueError:
+        return None
+
+
+_column_var_re = re.compile(r"^[\w\.]+$")
+
+_column_comparators = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b
+}
+
+
+def _evaluate_column_operand(node, get_column):
+    if node[0] == "var" and _column_var_re.match(node[1]):
+        return get_column(node[1]), True
+    elif node[0] == "lit" and isinstance(node[1], unicode):
+        return node[1], False
+    raise ValueError("Operand %s is not supported" % node)
+
+
+def _evaluate_columns(node, get_column, size):
+    op = node[0]
+    if op in ("and", "or", "not"):
+        left = _evaluate_columns(node[1], get_column, size)
+        if op == "not":
+            return [not x for x in left]
+        right = _evaluate_columns(node[2], get_column, size)
+        if op == "and":
+            return [a and b for a, b in zip(left, right)]
+        return [a or b for a, b in zip(left, right)]
+    elif op in _column_comparators:
+        left, left_is_column = _evaluate_column_operand(node[1], get_column)
+        right, right_is_column = _evaluate_column_operand(node[2],
+                                                          get_column)
+        compare = _column_comparators[op]
+        if left_is_column and right_is_column:
+            return [compare(a, b) for a, b in zip(left, right)]
+        elif left_is_column:
+            return [compare(a, right) for a in left]
+        elif right_is_column:
+            return [compare(left, b) for b in right]
+        return [compare(left, right)] * size
+    elif op == "in":
+        column, is_column = _evaluate_column_operand(node[1], get_column)
+        if (not is_column or node[2][0] != "lit"
+           or not isinstance(node[2][1], list)):
+            raise ValueError("Operands of %s are not supported" % node)
+        values = frozenset(node[2][1])
+        return [value in values for value in column]
+    elif op == "var":
+        column, is_column = _evaluate_column_operand(node, get_column)
+        return [bool(value) for value in column]
+    raise ValueError("Operator %s is not supported" % op)
+
+
+def evaluate_columns(tree, get_column, size):
+    """Evaluates the given syntax tree (see :func:`to_ast`) for many rows
+    at once and returns a list with the boolean result for every row.
+    The values of the variables are provided as columns with one string
+    value per row. Instead of evaluating the expression once per row
+    every operator is applied to a whole column.
+
+    Supported are comparisons of columns with other columns or string
+    literals, "in" with a list literal and the boolean operators. The
+    result is the same as evaluating a :class:`Rule` with the values of
+    each row.
+
+    :tree: Syntax tree of the expression
+    :get_column: Function which returns the column (sequence of
+    unicode strings) for the name of a variable
+    :size: Number of rows
+    :returns: List of booleans
+    :raises: ValueError if the expression is not supported.
+    """
+    if tree is None:
+        raise ValueError("Expression is not parsed")
+    return [bool(value) for value in _evaluate_columns(tree, get_column,
+                                                       size)]
+
+
+class Expression(BaseExpression):
+    """Expression which takes its parsed tree from the
+    :data:`expression_cache` instead of parsing the expression on every
+    initialisation."""
+
+    def __init__(self, expression):
+        """Initialise a Expression object
+
+        :expression: String representation of an Expression
+
+        """
+        self._expression = expression
+        self._expression_tree = expression_cache.get(expression)
 
 
 class Rule(Expression):
@@ -61,3 +405,29 @@ class Rule(Expression):
         if values is None:
             values = {}
         return bool(self._evaluate(self._expression_tree, values))
+
+
+def evaluate_rules(rules, values=None):
+    """Returns a list with the results of the evaluation of the given
+    rules in the same order as the rules. This function can be used to
+    implement the view behind the `eval_url` of a form which gets all
+    rules triggered by a change in the form with one request. An
+    expression which can not be evaluated has the result None.
+
+    :rules: List of expression strings or :class:`Rule` objects.
+    :values: Dictionary with values used in the evaluation of the
+    rules.
+    :returns: List of True, False or None.
+    """
+    if values is None:
+        values = {}
+    results = []
+    for rule in rules:
+        try:
+            if not isinstance(rule, Rule):
+                rule = Rule(rule)
+            results.append(rule.evaluate(values))
+        except Exception:
+            log.exception('Evaluation of "%s" failed' % rule)
+            results.append(None)
+    return results
@@ -7,6 +7,324 @@
 var reduce = Function.prototype.call.bind([].reduce);
 var map = Function.prototype.call.bind([].map);
 
+    /**
+     * @module
+     * Evaluates the client trees of expressions in the browser. The client
+     * tree is rendered in the "ast" attribute of conditionals (See
+     * formbar.rules.to_client_tree). The tokens are evaluated in the same
+     * way as brabbel evaluates the expression with the substituted values
+     * on the server. If the result might differ from the result of the
+     * server (e.g. on type mismatches or unsupported values) an error is
+     * thrown and the expression must be evaluated on the server.
+     *
+     * @public
+     * @function
+     *
+     * evaluate - evaluates a client tree
+     * parseValue - converts a substituted value into a typed value
+     */
+var expressionEvaluator = function () {
+    var operators = ["not", "+", "-", "*", "/", "<", "<=", ">=", ">", "==",
+                     "!=", "and", "or", "in"];
+    var functions = ["date", "float", "bool", "len", "timedelta"];
+    var NONE = {t: "none", v: null};
+    var MAX_INTEGER = 9007199254740992;
+
+    var unsupported = function (msg) {
+        throw new Error("Expression can not be evaluated on the client: " + msg);
+    };
+
+    var bool = function (v) {
+        return {t: "bool", v: v};
+    };
+
+    var integer = function (v) {
+        if (!(Math.abs(v) < MAX_INTEGER)) unsupported("integer " + v);
+        return {t: "int", v: v};
+    };
+
+    var isNumeric = function (x) {
+        return x.t === "int" || x.t === "float" || x.t === "bool";
+    };
+
+    var number = function (x) {
+        return Number(x.v);
+    };
+
+    /**
+     * @function
+     *
+     * checks that a string is parsed by brabbel the same way on the server
+     *
+     * @param {string} v - the string
+     */
+    var checkString = function (v) {
+        // Surrogates are counted differently in python; the operators
+        // "ge", "gt"... are replaced everywhere in the expression.
+        if (/[\uD800-\uDFFF]/.test(v) || / (ge|gt|lt|le|eq|ne) /.test(v)) {
+            unsupported("string " + v);
+        }
+        return {t: "str", v: v};
+    };
+
+    var parseNumber = function (s) {
+        if (/^-?\d+$/.test(s)) return integer(Number(s));
+        if (/^-?(\d+\.\d*|\.\d+)$/.test(s)) return {t: "float", v: parseFloat(s)};
+        unsupported("number " + s);
+    };
+
+    var parseItem = function (s) {
+        var match = /^'([^'\\\r\n]*)'$/.exec(s);
+        if (match) return checkString(match[1]);
+        if (/^-?[0-9.]+$/.test(s)) return parseNumber(s);
+        unsupported("value " + s);
+    };
+
+    /**
+     * @function
+     *
+     * parseValue is exported.
+     * Converts the value which is substituted for a variable into a typed
+     * value in the same way as brabbel parses it.
+     *
+     * @param {string} s - the substituted value
+     */
+    var parseValue = function (s) {
+        var match;
+        if (s === "None" || s === "False") return bool(false);
+        if (s === "True") return bool(true);
+        match = /^\[(.*)\]$/.exec(s);
+        if (match) {
+            var items = match[1] ? match[1].split(",") : [];
+            return {t: "list", v: items.map(function (item) {
+                return parseItem(item.trim());
+            })};
+        }
+        var value = parseItem(s);
+        // Strings which look like variables, operators or functions are
+        // not handled as strings by brabbel.
+        if (value.t === "str" && (value.v[0] === "$"
+                                  || operators.indexOf(value.v) !== -1
+                                  || functions.indexOf(value.v) !== -1)) {
+            unsupported("value " + s);
+        }
+        return value;
+    };
+
+    var literal = function (token) {
+        switch (token[0]) {
+            case "str":
+                // Spaces in the expression are doubled when the values
+                // are substituted. See ruleEngine.parseExpression
+                return checkString(token[1].replace(/ /g, "  "));
+            case "list":
+                return {t: "list", v: token[1].map(literal)};
+            case "int":
+                return integer(token[1]);
+            case "float":
+            case "bool":
+                return {t: token[0], v: token[1]};
+        }
+        unsupported("token " + token[0]);
+    };
+
+    var resolve = function (token, values) {
+        if (token[0] === "var") {
+            return values.hasOwnProperty(token[1]) ? values[token[1]] : NONE;
+        }
+        return literal(token);
+    };
+
+    var truth = function (x) {
+        switch (x.t) {
+            case "none":
+                return false;
+            case "bool":
+                return x.v;
+            case "int":
+            case "float":
+                return x.v !== 0;
+            default:
+                return x.v.length > 0;
+        }
+    };
+
+    var equal = function (a, b) {
+        if (isNumeric(a) && isNumeric(b)) return number(a) === number(b);
+        if (a.t !== b.t) return false;
+        if (a.t === "list") {
+            return a.v.length === b.v.length && a.v.every(function (x, i) {
+                return equal(x, b.v[i]);
+            });
+        }
+        return a.v === b.v;
+    };
+
+    var contains = function (a, b) {
+        if (b.t === "list") {
+            return bool(b.v.some(function (x) { return equal(a, x); }));
+        }
+        if (b.t === "str" && a.t === "str") return bool(b.v.indexOf(a.v) !== -1);
+        unsupported("in on " + b.t);
+    };
+
+    var callFunction = function (name, x) {
+        if (name === "bool") {
+            switch (x.t) {
+                case "none":
+                case "bool":
+                    return bool(truth(x));
+                case "str":
+                    return bool(x.v !== "''" && x.v.length > 0);
+                case "list":
+                    return bool(x.v.length > 0 && !(x.v[0].t === "str" && x.v[0].v === ""));
+                default:
+                    return bool(true);
+            }
+        }
+        if (name === "len") {
+            switch (x.t) {
+                case "none":
+                    return integer(0);
+                case "bool":
+                    return integer(x.v ? 4 : 5);
+                case "int":
+                    return integer(String(x.v).length);
+                case "str":
+                case "list":
+                    return integer(x.v.length);
+            }
+        }
+        unsupported("function " + name + " on " + x.t);
+    };
+
+    var arithmetic = function (op, a, b) {
+        if (op === "+" && (a.t === "str" || a.t === "list")) {
+            return {t: a.t, v: a.v.concat(b.v)};
+        }
+        if (!isNumeric(a)) unsupported(op + " on " + a.t);
+        var x = number(a);
+        var y = number(b);
+        var type = a.t === "float" ? "float" : "int";
+        var result;
+        switch (op) {
+            case "+": result = x + y; break;
+            case "-": result = x - y; break;
+            case "*": result = x * y; break;
+            case "/":
+                if (y === 0) unsupported("division by zero");
+                result = x / y;
+                // Brabbel truncates the division of integers.
+                if (type === "int") result = result < 0 ? Math.ceil(result) : Math.floor(result);
+                break;
+        }
+        return type === "int" ? integer(result) : {t: type, v: result};
+    };
+
+    var compare = function (op, a, b) {
+        var x, y;
+        if (isNumeric(a)) {
+            x = number(a);
+            y = number(b);
+        } else if (a.t === "str") {
+            x = a.v;
+            y = b.v;
+        } else {
+            unsupported(op + " on " + a.t);
+        }
+        switch (op) {
+            case "<": return bool(x < y);
+            case "<=": return bool(x <= y);
+            case ">": return bool(x > y);
+            case ">=": return bool(x >= y);
+        }
+    };
+
+    var bitwise = function (op, a, b) {
+        if (a.t === "bool") return bool(op === "and" ? a.v && b.v : a.v || b.v);
+        if (a.t !== "int" || Math.abs(a.v) >= 0x80000000 || Math.abs(b.v) >= 0x80000000) {
+            unsupported(op + " on " + a.t);
+        }
+        return integer(op === "and" ? a.v & b.v : a.v | b.v);
+    };
+
+    var evaluateTerm = function (op, operand) {
+        var a = operand[0];
+        var b = operand[1];
+        if (a === undefined) unsupported("missing operand");
+        if (op === null) return a;
+        if (op === "not") return bool(!truth(a));
+        if (b === undefined) unsupported("missing operand");
+        if (op === "in") return contains(a, b);
+        if (a.t !== b.t) unsupported("type of operands must be equal");
+        switch (op) {
+            case "==": return bool(equal(a, b));
+            case "!=": return bool(!equal(a, b));
+            case "+":
+            case "-":
+            case "*":
+            case "/":
+                return arithmetic(op, a, b);
+            case "<":
+            case "<=":
+            case ">":
+            case ">=":
+                return compare(op, a, b);
+            case "and":
+            case "or":
+                return bitwise(op, a, b);
+        }
+        unsupported("operator " + op);
+    };
+
+    var evaluateGroup = function (tokens, values) {
+        var operand = [];
+        var op = null;
+        for (var i = 0; i < tokens.length; i++) {
+            var token = tokens[i];
+            if (token[0] === "op") {
+                op = token[1];
+                if ((op === "and" || op === "or") && operand.length === 0) {
+                    unsupported("missing operand");
+                }
+                // Brabbel stops the evaluation of the group here.
+                if (op === "and" && !truth(operand[0])) return bool(false);
+                if (op === "or" && truth(operand[0])) return bool(true);
+            } else if (token[0] === "group") {
+                operand.push(evaluateGroup(token[1], values));
+            } else if (token[0] === "call") {
+                operand.push(callFunction(token[1], resolve(token[2], values)));
+            } else {
+                operand.push(resolve(token, values));
+            }
+            if (operand.length === 2) {
+                operand = [evaluateTerm(op, operand)];
+                op = null;
+            }
+        }
+        return evaluateTerm(op, operand);
+    };
+
+    /**
+     * @function
+     *
+     * evaluate is exported.
+     * Returns the result of the evaluation of the client tree as boolean.
+     *
+     * @param {Array} tree - the tokens of the client tree
+     *
+     * @param {Object} values - typed values of the variables (See parseValue)
+     */
+    var evaluate = function (tree, values) {
+        return truth(evaluateGroup(tree, values));
+    };
+
+    return {
+        evaluate: evaluate,
+        parseValue: parseValue
+    };
+} ();
+
     /** 
      * @module
      * Conatins the mechanics for evaluating fields and communication results
@@ -21,6 +339,42 @@ var map = Function.prototype.call.bind([].map);
      */
 var ruleEngine = function () {
     var conditionals;
+    // Client trees of the expressions which can be evaluated in the
+    // browser without asking the server.
+    var trees = {};
+    // Results of the server keyed by the expression with the substituted
+    // values. The oldest results are removed if the cache is full.
+    var results = {};
+    var resultKeys = [];
+    var MAX_RESULTS = 500;
+    // Checks which are sent to the server with the next request. Checks
+    // are collected for FLUSH_DELAY ms so that bursts of changes are sent
+    // with one request.
+    var pending = [];
+    var flushTimeout = null;
+    var FLUSH_DELAY = 20;
+    // Sequence number of the latest check per div and rule. Results of
+    // older checks are superseded and ignored.
+    var sequence = 0;
+    var latest = {};
+    // Requests to the server which are not finished yet.
+    var requests = [];
+    // Variables in expressions. Matches the variables found by
+    // formbar.rules.get_variables on the server.
+    var VARIABLE = /\$[\w.]+/g;
+
+    /**
+     * @function
+     *
+     * returns the variables used in the expression
+     *
+     * @param {string} expression - the expression
+     *
+     * @returns {Array} the variables including the leading "$"
+     */
+    var getVariables = function (expression) {
+        return expression.match(VARIABLE) || [];
+    };
 
     /** 
      * @function
@@ -32,50 +386,196 @@ var ruleEngine = function () {
      * in which div it occurs and its according expression
      * 
      */
-    var scanConditionals = function () {
-        return reduce($('.formbar-conditional'), function (o, n) {
+    var scanConditionals = function (root, conditionals) {
+        return reduce($(root || document).find('.formbar-conditional'), function (o, n) {
             var expr = n.getAttribute("expr");
-            var tokens = expr.split(" ");
             var id = n.getAttribute("id");
-            tokens.forEach(function (token) {
-                if (token[0] === '$') {
-                    var fieldName = token.replace("$", '');
-                    if (!o[fieldName]) o[fieldName] = {};
-                    o[fieldName][id] = {
-                        "id": id,
-                        "expr": expr
-                    };
-                }
+            var ast = n.getAttribute("ast");
+            if (ast) trees[expr] = JSON.parse(ast);
+            getVariables(expr).forEach(function (variable) {
+                var fieldName = variable.replace("$", '');
+                if (!o[fieldName]) o[fieldName] = {};
+                o[fieldName][id] = {
+                    "id": id,
+                    "expr": expr
+                };
             });
             return o;
-        }, {});
+        }, conditionals || {});
+    };
+
+    /**
+     * @function
+     *
+     * creates the check of a rule. Rules with a client tree are evaluated
+     * directly. All other rules get the expression without variables which
+     * is evaluated on the server.
+     *
+     * @param {string} rule - the expression of the rule
+     *
+     * @param {Object} currentValues - holds the current state of all fields
+     *
+     * @param {function} callBack - the function which is called with the result
+     *
+     * @param {string} divId - holding the ID of the div for further processing in
+     * the callback
+     */
+    var createCheck = function (rule, currentValues, callBack, divId) {
+        var check = {rule: rule, callBack: callBack, divId: divId};
+        // Every check supersedes the earlier checks of the rule, also
+        // if it is evaluated in the browser, so results of requests to
+        // the server for older values are ignored.
+        check.key = divId + " " + rule;
+        check.seq = ++sequence;
+        latest[check.key] = check.seq;
+        if (trees[rule]) {
+            try {
+                check.result = evaluateTree(trees[rule], rule, currentValues);
+                return check;
+            } catch (e) {
+                // Fall back to the evaluation on the server.
+            }
+        }
+        check.expression = parseExpression(rule, currentValues);
+        return check;
+    };
+
+    /**
+     * @function
+     *
+     * evaluates the client tree of a rule with the current values. The
+     * values are substituted in the same way as in parseExpression.
+     *
+     * @param {Array} tree - the client tree of the rule
+     *
+     * @param {string} expression - the expression of the rule
+     *
+     * @param {Object} currentValues - holds the current state of all fields
+     */
+    var evaluateTree = function (tree, expression, currentValues) {
+        var values = {};
+        getVariables(expression).forEach(function (variable) {
+            values[variable] = expressionEvaluator.parseValue(
+                String(substituteValue(variable, currentValues)));
+        });
+        return expressionEvaluator.evaluate(tree, values);
+    };
+
+    /**
+     * @function
+     *
+     * stores the result of an expression in the bounded result cache
+     *
+     * @param {string} expression - the expression without variables
+     *
+     * @param {boolean} result - the result of the server
+     */
+    var storeResult = function (expression, result) {
+        if (!results.hasOwnProperty(expression)) {
+            resultKeys.push(expression);
+            if (resultKeys.length > MAX_RESULTS) {
+                delete results[resultKeys.shift()];
+            }
+        }
+        results[expression] = result;
+    };
+
+    var isCurrent = function (check) {
+        return latest[check.key] === check.seq;
     };
 
     /** 
      * @function
      * 
-     * delegates the evaluation for the field to the server
-     * 
-     * @param {string} expression - holding the expression without variables
-     * 
-     * @param {string} divId - holding the ID of the div for further processing in 
-     * the callback
+     * calls back the results of rules which are evaluated on the client
+     * or which are already known from the result cache. All other rules
+     * are collected and delegated to the server (See flush).
      * 
-     * @param {function} callback - the function which is called with the result
+     * @param {Array} checks - list of checks (See createCheck)
      */
-    var checkFields = function (rule, expression, callBack, divId) {
-        var form = $("#" + divId).closest("form");
-        var eval_url = $(form).attr("evalurl");
-        var ruleParam = "?rule=" + encodeURIComponent(expression);
-        $.ajax({
-            type: "GET",
-            url: eval_url + ruleParam,
-            success: function (data) {
-                callBack(data.data, divId, rule);
-            },
-            error: function (data) {
-                console.log("Request to eval server fails!")
+    var checkFields = function (checks) {
+        checks.forEach(function (check) {
+            if (check.result === undefined) {
+                if (results.hasOwnProperty(check.expression)) {
+                    check.result = results[check.expression];
+                } else {
+                    pending.push(check);
+                }
+            }
+            if (check.result !== undefined) {
+                check.callBack(check.result, check.divId, check.rule);
+            }
+        });
+        if (pending.length && flushTimeout === null) {
+            flushTimeout = setTimeout(flush, FLUSH_DELAY);
+        }
+    };
+
+    /**
+     * @function
+     *
+     * sends the collected checks to the server. Checks which are
+     * superseded by a later check of the same rule are dropped and
+     * requests whose checks are all superseded are aborted. Every distinct
+     * expression is only sent once. The expressions are sent with one
+     * POST request per form in the "rules" parameter as JSON list. The
+     * server returns the results in the same order in the "data" attribute
+     * of the response. Results which are null could not be evaluated and
+     * are ignored.
+     */
+    var flush = function () {
+        var checks = pending.filter(isCurrent);
+        pending = [];
+        flushTimeout = null;
+        requests = requests.filter(function (request) {
+            if (request.checks.some(isCurrent)) return true;
+            request.xhr.abort();
+            return false;
+        });
+        var batches = reduce(checks, function (o, check) {
+            var form = $("#" + check.divId).closest("form");
+            var eval_url = $(form).attr("evalurl");
+            if (!o[eval_url]) o[eval_url] = {expressions: [], checks: []};
+            if (o[eval_url].expressions.indexOf(check.expression) === -1) {
+                o[eval_url].expressions.push(check.expression);
             }
+            o[eval_url].checks.push(check);
+            return o;
+        }, {});
+        Object.keys(batches).forEach(function (eval_url) {
+            var batch = batches[eval_url];
+            var request = {checks: batch.checks};
+            request.xhr = $.ajax({
+                type: "POST",
+                url: eval_url,
+                data: {
+                    rules: JSON.stringify(batch.expressions)
+                },
+                success: function (data) {
+                    batch.expressions.forEach(function (expression, i) {
+                        if (data.data[i] !== null) {
+                            storeResult(expression, data.data[i]);
+                        }
+                    });
+                    batch.checks.filter(isCurrent).forEach(function (check) {
+                        var result = data.data[batch.expressions.indexOf(check.expression)];
+                        if (result !== null) {
+                            check.callBack(result, check.divId, check.rule);
+                        }
+                    });
+                },
+                error: function (xhr, status) {
+                    if (status !== "abort") {
+                        console.log("Request to eval server fails!")
+                    }
+                },
+                complete: function () {
+                    requests = requests.filter(function (x) {
+                        return x !== request;
+                    });
+                }
+            });
+            requests.push(request);
         });
     };
 
@@ -91,16 +591,27 @@ var ruleEngine = function () {
      * 
      */
     var parseExpression = function (expression, currentValues) {
-        return expression.split(" ").map(function (token) {
-            if (token[0] === '$') {
-                var currentValue = convertValue(currentValues[token.replace("$", "")]);
-                var token = currentValue;
-                if (Array.isArray(currentValue)) {
-                    token = JSON.stringify(currentValue).replace(/"/g, "'");
-                }
-            }
-            return token;
-        }).join("  ");
+        return expression.replace(VARIABLE, function (variable) {
+            return substituteValue(variable, currentValues);
+        });
+    }
+
+    /**
+     * @function
+     *
+     * returns the value which is substituted for the variable
+     *
+     * @param {string} token - the variable
+     *
+     * @param {Object} map for lookup of variables
+     *
+     */
+    var substituteValue = function (token, currentValues) {
+        var currentValue = convertValue(currentValues[token.replace("$", "")]);
+        if (Array.isArray(currentValue)) {
+            return JSON.stringify(currentValue).replace(/"/g, "'");
+        }
+        return currentValue;
     }
 
 
@@ -172,10 +683,9 @@ var ruleEngine = function () {
     var onFieldChange = function (name, currentValues, callback) {
         if (conditionals[name]) {
             var rulesForField = conditionals[name];
-            Object.keys(rulesForField).forEach(function (k) {
-                var rule = rulesForField[k].expr;
-                checkFields(rule, parseExpression(rule, currentValues), callback, k);
-            });
+            checkFields(Object.keys(rulesForField).map(function (k) {
+                return createCheck(rulesForField[k].expr, currentValues, callback, k);
+            }));
         }
         return true;
     }
@@ -196,16 +706,120 @@ var ruleEngine = function () {
      *  
      */
     var evaluateRule = function(fieldname, currentValues, callback, rule){
-        checkFields(rule, parseExpression(rule, currentValues), callback, fieldname);
+        checkFields([createCheck(rule, currentValues, callback, fieldname)]);
     }
 
-    var init = function () {
-        conditionals = scanConditionals();
+    /**
+     * @function
+     *
+     * evaluateRules is exported.
+     * Evaluates several rules of a field with one request
+     *
+     * @param {string} fieldname - the name of the field / variable which is changed
+     *
+     * @param {string} currentValues - holds the current state of all fields
+     *
+     * @param {string} callBack - a function to call back after evaluation
+     *
+     * @param {Array} rules - the expressions of the rules to be evaluated
+     *
+     */
+    var evaluateRules = function(fieldname, currentValues, callback, rules){
+        checkFields(rules.map(function (rule) {
+            return createCheck(rule, currentValues, callback, fieldname);
+        }));
+    }
+
+    /**
+     * @function
+     *
+     * takes the conditionals from the manifest rendered by the server
+     * instead of scanning the form. See formbar.renderer.ClientManifest
+     *
+     * @param {Object} manifest - conditionals of the manifest by id
+     */
+    var loadConditionals = function (manifest, conditionals) {
+        Object.keys(manifest).forEach(function (id) {
+            var conditional = manifest[id];
+            if (conditional.ast) trees[conditional.expr] = conditional.ast;
+            conditional.fields.forEach(function (fieldName) {
+                if (!conditionals[fieldName]) conditionals[fieldName] = {};
+                conditionals[fieldName][id] = {
+                    "id": id,
+                    "expr": conditional.expr
+                };
+            });
+        });
+        return conditionals;
+    };
+
+    /**
+     * @function
+     *
+     * initialises the conditionals of the form
+     *
+     * @param {Object} manifest - conditionals of the manifest. If not
+     * given the form is scanned for conditionals.
+     */
+    var init = function (manifest) {
+        if (manifest) {
+            conditionals = loadConditionals(manifest, {});
+        } else {
+            conditionals = scanConditionals();
+        }
+    };
+
+    /**
+     * @function
+     *
+     * adds the conditionals of a loaded page
+     *
+     * @param {Object} root - DOM-Node of the loaded page
+     *
+     * @param {Object} manifest - conditionals of the manifest of the page
+     *
+     * @returns {Array} the ids and expressions of the added conditionals
+     */
+    var addConditionals = function (root, manifest) {
+        if (manifest) {
+            conditionals = loadConditionals(manifest, conditionals);
+            return Object.keys(manifest).map(function (id) {
+                return {id: id, expr: manifest[id].expr};
+            });
+        }
+        conditionals = scanConditionals(root, conditionals);
+        return map($(root).find('.formbar-conditional'), function (n) {
+            return {id: n.getAttribute("id"), expr: n.getAttribute("expr")};
+        });
+    };
+
+    /**
+     * @function
+     *
+     * checkConditionals is exported.
+     * Evaluates the given conditionals with the current values, e.g. the
+     * conditionals of a loaded page which have been rendered with the
+     * values stored on the server.
+     *
+     * @param {Array} added - ids and expressions of the conditionals
+     *
+     * @param {Object} currentValues - holds the current state of all fields
+     *
+     * @param {function} callBack - a function to call back after evaluation
+     */
+    var checkConditionals = function (added, currentValues, callback) {
+        checkFields(added.map(function (conditional) {
+            return createCheck(conditional.expr, currentValues, callback,
+                               conditional.id);
+        }));
     };
     return {
         init: init,
+        addConditionals: addConditionals,
+        checkConditionals: checkConditionals,
         onFieldChange: onFieldChange,
-        evaluateRule: evaluateRule
+        evaluateRule: evaluateRule,
+        evaluateRules: evaluateRules
     };
 } ();
 
@@ -423,18 +1037,49 @@ var form = function (inputFilter, ruleEngine) {
         }
     }
 
+    /**
+     * @function
+     *
+     * sets the value of the field with the given name within root. Used
+     * to keep the current values of the client in pages which are loaded
+     * on demand.
+     *
+     * @param {Object} root - DOM-Node containing the field
+     *
+     * @param {string} fieldName - the name of the field
+     *
+     * @param {Object} value - the value (a list for checkboxes)
+     */
+    var applyFieldValue = function (root, fieldName, value) {
+        var field = $(root).find("[name='" + fieldName + "']").not("[type='hidden']");
+        if (!field.length || value === undefined) return;
+        switch (field.attr("type")) {
+            case "checkbox":
+            case "radio":
+                field.prop("checked", false);
+                [].concat(value).forEach(function (x) {
+                    field.filter("[value='" + x + "']").prop("checked", true);
+                });
+                break;
+            default:
+                field.val(value);
+                break;
+        }
+    };
+
     /**
      * @function
      * 
      * sets the eventlisteners for the input fields
      * 
      */
-    var initInputFilters = function () {
-        $('div.formbar-form input.integer').keypress(inputFilter.integer);
-        $('div.formbar-form input.float').keypress(inputFilter.float);
-        $('div.formbar-form input.date').keypress(inputFilter.date);
-        $('div.formbar-form input.datetime').keypress(inputFilter.datetime);
-        $('div.formbar-form input.currency').keypress(inputFilter.currency);
+    var initInputFilters = function (root) {
+        root = $(root || 'div.formbar-form');
+        root.find('input.integer').keypress(inputFilter.integer);
+        root.find('input.float').keypress(inputFilter.float);
+        root.find('input.date').keypress(inputFilter.date);
+        root.find('input.datetime').keypress(inputFilter.datetime);
+        root.find('input.currency').keypress(inputFilter.currency);
     };
 
 
@@ -467,8 +1112,8 @@ var form = function (inputFilter, ruleEngine) {
      * these elements. Acts as a simple model.
      *
      */
-    var scanComponents = function () {
-        return reduce($(".form-group"), function (o, x) {
+    var scanComponents = function (root, components) {
+        return reduce($(root || document).find(".form-group"), function (o, x) {
             var name = $(x).attr("formgroup");
             if (name) {
                 var state = ($(x).hasClass("active")) ? "active" : "inactive";
@@ -493,6 +1138,102 @@ var form = function (inputFilter, ruleEngine) {
                 };
             }
             return o;
+        }, components || {});
+    };
+
+    /**
+     * @function
+     *
+     * reads the manifests rendered by the server. See
+     * formbar.renderer.ClientManifest
+     *
+     * @param {Object} root - DOM-Node which contains the manifests
+     *
+     * @returns {Object} the merged fields and conditionals of all
+     * manifests or null if there is no manifest
+     */
+    var readManifest = function (root) {
+        var scripts = $(root || document).find("script.formbar-manifest");
+        if (!scripts.length) return null;
+        return reduce(scripts, function (o, script) {
+            var data = JSON.parse(script.textContent);
+            var form = $(script).closest("form")[0];
+            Object.keys(data.fields).forEach(function (name) {
+                data.fields[name].form = form;
+                o.fields[name] = data.fields[name];
+            });
+            Object.keys(data.conditionals).forEach(function (id) {
+                o.conditionals[id] = data.conditionals[id];
+            });
+            return o;
+        }, {fields: {}, conditionals: {}});
+    };
+
+    /**
+     * @function
+     *
+     * builds the model of the fields from the manifest. Only the current
+     * values are taken from the content elements of the fields.
+     *
+     * @param {Object} fields - fields of the manifest by name
+     *
+     * @param {Object} components - already known fields
+     */
+    var loadComponents = function (fields, components) {
+        return reduce(Object.keys(fields), function (o, name) {
+            var field = fields[name];
+            var form = field.form;
+            var selector = "[name='" + name + "']";
+            var element = form && (form.querySelector("input" + selector)
+                                   || form.querySelector("textarea" + selector)
+                                   || form.querySelector("select" + selector));
+            var value = getFieldValue(element);
+            var datatype = (element)?element.getAttribute("datatype"):undefined;
+            var dirtyable = !element || (!element.getAttribute("no-dirtyable") && !$(form).hasClass("no-dirtyable") && !form.getAttribute("no-dirtyable"));
+            o[name] = {
+                'name': name,
+                'state': field.state,
+                'initialstate': field.state,
+                'value': value,
+                'initialvalue': value,
+                'desired': field.desired,
+                'required': field.required,
+                'datatype': datatype,
+                'rules': field.rules,
+                'dirtyable':dirtyable,
+            };
+            return o;
+        }, components || {});
+    };
+
+    /**
+     * @function
+     *
+     * gathers the values of the fields on pages which are not loaded
+     * yet. These values are rendered as hidden fields and are only used
+     * for the evaluation of rules.
+     *
+     */
+    var scanLazyValues = function () {
+        return reduce($(".formbar-page[formbar-lazy] input[type='hidden']"), function (o, x) {
+            var name = x.getAttribute("name");
+            var value = x.value;
+            if (o[name]) {
+                if (!Array.isArray(o[name].value)) o[name].value = [o[name].value];
+                o[name].value.push(value);
+            } else {
+                o[name] = {
+                    'name': name,
+                    'state': 'active',
+                    'initialstate': 'active',
+                    'value': value,
+                    'initialvalue': value,
+                    'datatype': x.getAttribute("datatype"),
+                    'rules': [],
+                    'dirtyable': false,
+                };
+            }
+            return o;
         }, {});
     };
 
@@ -505,7 +1246,7 @@ var form = function (inputFilter, ruleEngine) {
      * @param {Object} x - DOM-Node
      */
     scanForContentElements = function(x){
-        return $(x).find("input")[0]||$(x).find("textarea")[0]||$(x).find("select")[0];
+        return $(x).find("input[name]")[0]||$(x).find("textarea")[0]||$(x).find("select")[0];
     }
 
     /**
@@ -716,17 +1457,15 @@ var form = function (inputFilter, ruleEngine) {
      * 
      */
     var evaluateRules = function(element){
-        element.rules.forEach(function(rule){
-            ruleEngine.evaluateRule(element.name, formFields, function (result, divId, rule) {
-                messageDiv=$("[rule='"+rule+"']");
-                if (result) {
-                    if(messageDiv.hasClass("hidden")=== false) messageDiv.addClass("hidden");
-                } else {
-                    if(messageDiv.hasClass("hidden")=== true) messageDiv.removeClass("hidden");
-                }
+        ruleEngine.evaluateRules(element.name, formFields, function (result, divId, rule) {
+            messageDiv=$("[rule='"+rule+"']");
+            if (result) {
+                if(messageDiv.hasClass("hidden")=== false) messageDiv.addClass("hidden");
+            } else {
+                if(messageDiv.hasClass("hidden")=== true) messageDiv.removeClass("hidden");
+            }
 
-            }, rule.expr);
-        });
+        }, element.rules.map(function (rule) { return rule.expr; }));
     }
 
     /**
@@ -757,10 +1496,16 @@ var form = function (inputFilter, ruleEngine) {
      *
      */
     var setListener = function () {
-        var timeOutID;
+        // Timeouts of the delayed change events per field
+        var timeOutIDs = {};
         var changeEvent = function(e){
             var div = $(e.target);
             var fieldName = e.target.name;
+            // A pending change of the same field is superseded.
+            if (timeOutIDs[fieldName]) {
+                clearTimeout(timeOutIDs[fieldName]);
+                delete timeOutIDs[fieldName];
+            }
             if (formFields[fieldName]){
                 if (formFields[fieldName].state==='inactive'){
                     if (div.closest(".formbar-conditional").attr("reset-value") == "true") {
@@ -782,8 +1527,9 @@ var form = function (inputFilter, ruleEngine) {
             switch (e.target.tagName) {
                 case 'INPUT':
                 case 'TEXTAREA':
-                    if(timeOutID) clearTimeout(timeOutID)
-                    timeOutID = setTimeout(function(){
+                    if(timeOutIDs[e.target.name]) clearTimeout(timeOutIDs[e.target.name])
+                    timeOutIDs[e.target.name] = setTimeout(function(){
+                        delete timeOutIDs[e.target.name];
                         changeEvent(e);
                     }, 400);
                     break;
@@ -810,13 +1556,62 @@ var form = function (inputFilter, ruleEngine) {
     };
 
     var init = function () {
+        var manifest = readManifest();
         initInputFilters();
-        formFields = scanComponents();
+        if (manifest) {
+            formFields = loadComponents(manifest.fields, scanLazyValues());
+        } else {
+            formFields = scanComponents(document, scanLazyValues());
+        }
         setListener();
-        ruleEngine.init();
+        ruleEngine.init(manifest && manifest.conditionals);
+    };
+
+    /**
+     * @function
+     *
+     * initialises the fields and conditionals of a page which has been
+     * loaded on demand. The page is rendered with the values stored on
+     * the server, so the current values of the client (values changed
+     * on other pages or submitted values of a form which failed to
+     * validate) are applied to the fields of the page and the
+     * conditionals of the page are evaluated again. Hidden copies of the
+     * values of the loaded fields on other lazy pages are removed so
+     * the values are only submitted once.
+     *
+     * @param {Object} root - DOM-Node of the loaded page
+     */
+    var addPage = function (root) {
+        var manifest = readManifest(root);
+        var names = Object.keys(manifest ? manifest.fields : scanComponents(root));
+        var known = {};
+        names.forEach(function (name) {
+            $(root).closest("form")
+                .find(".formbar-page[formbar-lazy] input[type='hidden'][name='" + name + "']")
+                .remove();
+            if (formFields[name]) {
+                known[name] = formFields[name];
+                applyFieldValue(root, name, formFields[name].value);
+            }
+        });
+        initInputFilters(root);
+        if (manifest) {
+            formFields = loadComponents(manifest.fields, formFields);
+        } else {
+            formFields = scanComponents(root, formFields);
+        }
+        // The initial values are still the values the form was rendered
+        // with, so changed values keep the form dirty.
+        Object.keys(known).forEach(function (name) {
+            formFields[name].initialvalue = known[name].initialvalue;
+            formFields[name].initialstate = known[name].initialstate;
+        });
+        var added = ruleEngine.addConditionals(root, manifest && manifest.conditionals);
+        ruleEngine.checkConditionals(added, formFields, toggleConditional);
     };
     return {
         init: init,
+        addPage: addPage,
         getFormFields: function(){
                 return formFields;
             },
@@ -972,10 +1767,10 @@ var formbar = function (form) {
      * handles initialization of date-Picker
      *
      */
-    var initDatePicker = function () {
+    var initDatePicker = function (root) {
         var browserLanguage = getBrowserLanguage();
         var dateFormat = getDateFormat(browserLanguage);
-        $('.formbar-datepicker').datepicker({
+        $(root || document).find('.formbar-datepicker').datepicker({
             language: browserLanguage,
             format: dateFormat,
             todayBtn: "linked",
@@ -990,10 +1785,10 @@ var formbar = function (form) {
      * handles initialization of datetime-Picker
      *
      */
-    var initDateTimePicker = function () {
+    var initDateTimePicker = function (root) {
         var browserLanguage = getBrowserLanguage();
         var dateFormat = getDateTimeFormat(browserLanguage);
-        $('.formbar-datetimepicker').datetimepicker({
+        $(root || document).find('.formbar-datetimepicker').datetimepicker({
             locale: browserLanguage,
             format: dateFormat
         });
@@ -1057,6 +1852,9 @@ var formbar = function (form) {
         setSelectedPage(e);
         $('.formbar-page').hide();
         selectedFormpage.show();
+        if (selectedFormpage.attr('formbar-lazy')) {
+            loadPage(page, selectedFormpage);
+        }
 
         // Hack! Force a resize event on page change. This will trigger
         // repainting the page. This hack fixes issues with sizes of elements
@@ -1072,6 +1870,106 @@ var formbar = function (form) {
         toggleNextPageSubmit(e);
     };
 
+    /**
+     * @function
+     *
+     * loads the content of a page which has not been rendered with
+     * the form from the pageurl of the form.
+     *
+     * @param {string} page - number of the page
+     *
+     * @param {Object} element - the (empty) page element
+     */
+    var loadPage = function (page, element) {
+        var pageurl = element.closest("form").attr("pageurl");
+        element.removeAttr('formbar-lazy');
+        $.ajax({
+            type: "GET",
+            url: pageurl,
+            data: {page: page},
+            success: function (data) {
+                element.html(data);
+                // Applies the current values before the widgets of the
+                // page are initialised.
+                form.addPage(element);
+                element.find('.formbar-tooltip').tooltip();
+                initDatePicker(element);
+                initDateTimePicker(element);
+                initRemoteSelection(element);
+                hideSubmitButtonOnInputlessPage(element);
+            },
+            error: function (data) {
+                element.attr('formbar-lazy', 'true');
+                console.log("Request to load page " + page + " fails!")
+            }
+        });
+    };
+
+    /**
+     * @function
+     *
+     * initialises the remote selections. The options of a remote
+     * selection are searched and loaded page by page from the
+     * optionurl of the selection.
+     *
+     * @param {Object} root - DOM-Node containing the remote selections
+     */
+    var initRemoteSelection = function (root) {
+        $(root || document).find('.formbar-remoteselection').each(function (i, element) {
+            var container = $(element);
+            var select = container.find('select');
+            var search = container.find('.formbar-remoteselection-search');
+            var more = container.find('.formbar-remoteselection-more');
+            var timeOutID;
+            var page = 1;
+            var load = function (append) {
+                $.ajax({
+                    type: "GET",
+                    url: container.attr('formbar-optionurl'),
+                    data: {
+                        field: container.attr('formbar-field'),
+                        search: search.val(),
+                        page: page,
+                        pagesize: container.attr('formbar-pagesize')
+                    },
+                    success: function (data) {
+                        if (!append) {
+                            select.find('option').not(':selected').not("[value='']").remove();
+                        }
+                        data.options.forEach(function (option) {
+                            if (select.find("option[value='" + option.value + "']").length === 0) {
+                                select.append($('<option>').val(option.value).text(option.label));
+                            }
+                        });
+                        more.toggleClass('hidden', !data.more);
+                    },
+                    error: function (data) {
+                        console.log("Request to load options fails!")
+                    }
+                });
+            };
+            search.on('keyup', function (e) {
+                // Do not handle the search as change of the form.
+                e.stopPropagation();
+                if (timeOutID) clearTimeout(timeOutID);
+                timeOutID = setTimeout(function () {
+                    page = 1;
+                    load(false);
+                }, 400);
+            });
+            search.on('change', function (e) {
+                e.stopPropagation();
+            });
+            more.on('click', function () {
+                page += 1;
+                load(true);
+            });
+            select.one('focus', function () {
+                load(false);
+            });
+        });
+    };
+
     var init = function () {
         $('.formbar-tooltip').tooltip();
         $('.list-group-item').on('click', selectListGroupItem);
@@ -1080,6 +1978,7 @@ var formbar = function (form) {
         $('div.formbar-form form').not(".disable-double-submit-prevention").preventDoubleSubmission();
         initDatePicker();
         initDateTimePicker();
+        initRemoteSelection();
         initSubmit();
         form.init();
     };
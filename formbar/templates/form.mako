@@ -1,6 +1,20 @@
-## Render pages
+## The body of the form is rendered in parts (start, pages or elements,
+## end) so that it can also be streamed part by part. See
+## FormRenderer.render_iter.
+<% paged = render_outline and len(form.pages) > 0 %>\
+${self.render_body_start(paged)}
+% if paged:
+  % for num, page in enumerate(form.pages):
+    ${self.render_page_container(num, page)}
+  % endfor
+% else:
+    ${self.render_recursive(form._config._tree)}
+% endif
+${self.render_body_end(paged)}
+
+<%def name="render_body_start(paged)">
 <div class="row">
-% if render_outline and len(form.pages) > 0:
+% if paged:
   <div class="col-sm-3 hidden-print">
     <div>
       <div class="panel panel-default formbar-outline">
@@ -20,20 +34,6 @@
     </div>
   </div>
   <div class="col-sm-9">
-  % for num, page in enumerate(form.pages):
-    <div class="formbar-page ${num==form.current_page-1 and 'active'}" id="formbar-page-${num+1}">
-      <h1 class="page">${_(page.attrib.get('label'))}</h1>
-      ## Render errors and warnings
-      % for warn in form.warnings:
-        <div class="alert alert-warning" role="warning"><i class="glyphicon glyphicon-exclamation-sign"></i> ${warn}</div>
-      % endfor
-      % for err in form.errors:
-        <div class="alert alert-danger" role="alert"><i class="glyphicon glyphicon-exclamation-sign"></i> ${err}</div>
-      % endfor
-      ${self.render_recursive(page)}
-    </div>
-  % endfor
-  </div>
 % else:
   <div class="col-sm-12">
       ## Render errors and warnings
@@ -43,10 +43,62 @@
       % for err in form.errors:
         <div class="alert alert-danger" role="alert"><i class="glyphicon glyphicon-exclamation-sign"></i> ${err}</div>
       % endfor
-    ${self.render_recursive(form._config._tree)}
-  </div>
 % endif
+</%def>
+
+<%def name="render_body_end(paged)">
+  </div>
 </div>
+</%def>
+
+<%def name="render_page_container(num, page)">
+  <% selected_page = max(form.current_page, 1) - 1 %>
+  % if only_page and num != selected_page:
+    ## Pages are loaded on demand. The values of the fields on the page
+    ## are included as hidden fields to submit them with the form and to
+    ## make them available for the rule evaluation on the client.
+    <div class="formbar-page" id="formbar-page-${num+1}" formbar-lazy="true">
+      ${self.render_hidden_values(page, rendered)}
+    </div>
+  % else:
+    <div class="formbar-page ${(num==form.current_page-1 or only_page) and 'active'}" id="formbar-page-${num+1}">
+      ${self.render_page(page)}
+    </div>
+  % endif
+</%def>
+
+<%def name="render_page(page)">
+  <h1 class="page">${_(page.attrib.get('label'))}</h1>
+  ## Render errors and warnings
+  % for warn in form.warnings:
+    <div class="alert alert-warning" role="warning"><i class="glyphicon glyphicon-exclamation-sign"></i> ${warn}</div>
+  % endfor
+  % for err in form.errors:
+    <div class="alert alert-danger" role="alert"><i class="glyphicon glyphicon-exclamation-sign"></i> ${err}</div>
+  % endfor
+  ${self.render_recursive(page)}
+</%def>
+
+<%def name="render_hidden_values(page, rendered)">
+  ## Fields which are already rendered (on the selected page or as
+  ## hidden field of a previous page) are skipped.
+  % for name in sorted(form._schema.get_page_fieldnames(page)):
+    <%
+      if name in rendered:
+        continue
+      rendered.add(name)
+      field = form.get_field(name)
+      if field.readonly:
+        continue
+      value = field.get_value()
+      if not isinstance(value, list):
+        value = [value]
+    %>
+    % for v in value:
+      <input type="hidden" name="${name}" value="${v}" datatype="${get_field_type(field)}"/>
+    % endfor
+  % endfor
+</%def>
 
 <%def name="render_recursive_outline(form, element)">
   % for child in element:
@@ -65,7 +117,8 @@
         else:
           css_class = "inactive {} {}".format(child.attrib.get('type'), '' if is_readonly else 'hidden')
       %>
-      <div id="${id(child)}" class="formbar-conditional ${css_class}" reset-value="${child.attrib.get('reset-value', 'false')}" expr="${child.attrib.get('expr')}">
+      <% manifest.add_conditional(child) %>
+      <div id="${id(child)}" class="formbar-conditional ${css_class}" reset-value="${child.attrib.get('reset-value', 'false')}" expr="${child.attrib.get('expr')}" ast="${get_client_tree_json(child.attrib.get('expr'))}">
     % endif
     % if child.attrib.get("static") != "true" or Rule(child.attrib.get("expr")).evaluate(form.merged_data):
       ${self.render_recursive_outline(form, child)}
@@ -83,8 +136,9 @@
   </a>
 </%def>
 
-<%def name="render_recursive(elem, mode='', active=True)">
-  % for child in elem:
+<%def name="render_recursive(elem, mode='', active=True, children=None)">
+  ## Only the given children of the element are rendered if provided.
+  % for child in (elem if children is None else children):
     <%
       if mode == 'hide':
         continue
@@ -131,7 +185,8 @@
           # hidden on initial load of the form.
           css_class = "inactive {} {}".format(child.attrib.get('type'), '' if is_readonly else 'hidden')
         %>
-        <div id="${id(child)}" type="${child.attrib.get('type')}" class="formbar-conditional ${css_class}" reset-value="${child.attrib.get('reset-value', 'false')}" expr="${child.attrib.get('expr')}">
+        <% manifest.add_conditional(child) %>
+        <div id="${id(child)}" type="${child.attrib.get('type')}" class="formbar-conditional ${css_class}" reset-value="${child.attrib.get('reset-value', 'false')}" expr="${child.attrib.get('expr')}" ast="${get_client_tree_json(child.attrib.get('expr'))}">
       % elif child.tag == "html":
         ${ElementTree.tostring(child) | n}
       % endif
@@ -167,6 +222,7 @@
           field = form.get_field(form._config._id2name[child.attrib.get('ref')])
           if mode == "readonly":
             field.readonly = True
+          manifest.add_field(field, active)
         %>
         ${field.render(active) | n}
       % elif child.tag == "button" and not child.attrib.get("ignore"):
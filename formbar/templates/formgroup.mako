@@ -0,0 +1,37 @@
+## Renders the complete form group of a field in one pass: the label,
+## the body of the field (template of the renderer), errors and help.
+<%
+class_options = (len(field.errors) and 'has-error',
+                 len(field.warnings) and 'has-warning',
+                 'active' if active else 'inactive')
+%>\
+<div class="form-group ${"%s %s %s" % class_options}" desired="${field.desired}" formgroup="${field.name}" required="${field.required}" rules="${";".join(rules)}">\
+% if renderer.label_width > 0 and renderer.label_position in ["left", "right"]:
+<div class="row">\
+  % if renderer.label_position == "left":
+<div align="${renderer.label_align}" class="col-sm-${renderer.label_width}">\
+<%include file="label.mako"/>\
+</div><div class="col-sm-${12 - renderer.label_width}">\
+<% renderer.template.render_context(context) %>\
+<%include file="errors.mako"/>\
+<%include file="help.mako"/>\
+</div>\
+  % else:
+<div class="col-sm-${12 - renderer.label_width}">\
+<% renderer.template.render_context(context) %>\
+<%include file="errors.mako"/>\
+<%include file="help.mako"/>\
+</div><div align="${renderer.label_align}" class="col-sm-${renderer.label_width}">\
+<%include file="label.mako"/>\
+</div>\
+  % endif
+</div>\
+% else:
+<%include file="label.mako"/>\
+<div style="padding-left: ${indent_padding}px">\
+<% renderer.template.render_context(context) %>\
+</div>\
+<%include file="errors.mako"/>\
+<%include file="help.mako"/>\
+% endif
+</div>\
@@ -0,0 +1,21 @@
+<%
+selected = field.get_selected_options()
+%>
+% if field.readonly:
+  <div class="readonlyfield" name="${field.name}">
+    ${", ".join(unicode(option[0]) for option in selected) or "&nbsp;"}
+  </div>
+% else:
+  <div class="formbar-remoteselection" formbar-optionurl="${renderer.get_option_url()}" formbar-field="${field.name}" formbar-pagesize="${renderer.pagesize or 20}">
+    <input type="text" class="form-control formbar-remoteselection-search" placeholder="${_('Search')}" no-dirtyable="true"/>
+    <select class="form-control" id="${field.id}" name="${field.name}" datatype="${get_field_type(field)}" ${'multiple' if multiple else ''}>
+      % if not multiple:
+        <option value="">${_('no selection')}</option>
+      % endif
+      % for option in selected:
+        <option value="${option[1]}" selected="selected">${option[0]}</option>
+      % endfor
+    </select>
+    <button type="button" class="btn btn-default btn-xs formbar-remoteselection-more hidden">${_('More')}</button>
+  </div>
+% endif
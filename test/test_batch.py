@@ -0,0 +1,77 @@
+import os
+import unittest
+
+from formbar import test_dir
+from formbar.config import load, Config
+from formbar.form import Form, Validator, ValidationException
+from formbar.batch import BatchValidator, validate_parallel
+
+RECORDS = [
+    {'default': 'test', 'integer': '16', 'date': '1998-02-01'},
+    {'default': 'test', 'integer': '15', 'date': '1998-02-01'},
+    {'select': '2', 'default': 'test', 'integer': '16', 'date': '1998-02-01'},
+    {'default': 'test', 'integer': 'foo', 'date': '1998-02-01'},
+]
+
+
+class TestBatchValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config(load(os.path.join(test_dir, 'form.xml')))
+        self.validator = BatchValidator(self.config.get_form('customform'))
+
+    def test_same_as_form(self):
+        results = list(self.validator.validate(RECORDS))
+        self.assertEqual(len(results), len(RECORDS))
+        for values, result in zip(RECORDS, results):
+            form = Form(self.config.get_form('customform'))
+            ok = form.validate(values)
+            self.assertEqual(result, (ok, form.data, form.get_errors(),
+                                      form.get_warnings()))
+
+    def test_no_state_between_records(self):
+        results = list(self.validator.validate(RECORDS[1:3]))
+        self.assertEqual(results[0][0], False)
+        self.assertEqual(results[1][0], True)
+        self.assertEqual(results[1][2], {})
+        self.assertTrue('integer' in results[0][2])
+
+    def test_validator_message_between_records(self):
+        def check(field, data):
+            if data['integer'] == 15:
+                raise ValidationException("15 is not allowed")
+            return data['integer'] > 16
+
+        validator = BatchValidator(
+            self.config.get_form('customform'),
+            validators=[Validator('integer', 'Too small', check)])
+        results = list(validator.validate(RECORDS[1:3]))
+        self.assertTrue('15 is not allowed' in results[0][2]['integer'])
+        self.assertEqual(results[1][2]['integer'], ['Too small'])
+
+    def test_parallel(self):
+        records = RECORDS * 5
+        expected = list(self.validator.validate(records))
+        results = list(validate_parallel(os.path.join(test_dir, 'form.xml'),
+                                         'customform', records,
+                                         workers=2, chunksize=3))
+        self.assertEqual(results, expected)
+
+    def test_parallel_bounded(self):
+        consumed = []
+
+        def records():
+            for i in range(100):
+                consumed.append(i)
+                yield RECORDS[i % len(RECORDS)]
+
+        results = validate_parallel(os.path.join(test_dir, 'form.xml'),
+                                    'customform', records(),
+                                    workers=2, chunksize=3)
+        next(results)
+        # Not more than 2 * workers chunks are sent to the pool.
+        self.assertTrue(len(consumed) <= 4 * 3)
+        self.assertEqual(len(list(results)), 99)
+
+if __name__ == '__main__':
+    unittest.main()
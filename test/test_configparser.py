@@ -1,7 +1,9 @@
 import unittest
 import os
+import shutil
+import tempfile
 from formbar import test_dir
-from formbar.config import load, Config, Form
+from formbar.config import load, Config, Form, ConfigCache
 
 
 class TestConfigParser(unittest.TestCase):
@@ -92,6 +94,71 @@ class TestFormParser(unittest.TestCase):
     def test_id_custom(self):
         self.assertEqual(self.cform.id, 'customform')
 
+    def test_get_form_cached(self):
+        form = self.config.get_form('customform')
+        self.assertFalse(form is self.cform)
+        self.assertTrue(form.get_schema() is self.cform.get_schema())
+
+    def test_get_form_mutation(self):
+        self.cform.readonly = True
+        self.cform.css = "changed"
+        form = self.config.get_form('customform')
+        self.assertFalse(form.readonly)
+        self.assertEqual(form.css, "testcss")
+
+    def test_schema_shared(self):
+        self.assertTrue(self.cform.get_schema() is self.cform.get_schema())
+
+    def test_schema_fields(self):
+        schema = self.cform.get_schema()
+        self.assertEqual(set(schema.fieldnames),
+                         set(self.cform.get_fields().keys()))
+        self.assertEqual(len(schema.rules['integer']), 2)
+        self.assertEqual(len(schema.validators['integer']), 1)
+        self.assertEqual(schema.id2name['e1'], 'string')
+
+    def test_schema_read_only(self):
+        schema = self.cform.get_schema()
+        self.assertRaises(AttributeError, setattr, schema, 'id', 'foo')
+
+
+class TestConditionals(unittest.TestCase):
+
+    def setUp(self):
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        self.config = Config(tree)
+        self.form = self.config.get_form('conditionalform')
+
+    def _get_walked_fieldnames(self, values):
+        fields = {}
+        for page_fields in self.form.init_fields(values, True).values():
+            fields.update(page_fields)
+        return set(fields.keys())
+
+    def test_conditional_index(self):
+        schema = self.form.get_schema()
+        self.assertEqual(schema.conditionals['string'], set([()]))
+        self.assertEqual(schema.conditionals['float'],
+                         set([("$string == 'foo'", "$integer ge 16"), ()]))
+        self.assertEqual(schema.expression_vars["$integer ge 16"],
+                         set(["integer"]))
+
+    def test_active_fields(self):
+        schema = self.form.get_schema()
+        for values in ({},
+                       {"string": u"foo"},
+                       {"string": u"foo", "integer": 16},
+                       {"string": u"foo", "integer": 1},
+                       {"string": u"bar", "integer": 16}):
+            self.assertEqual(schema.get_active_fieldnames(values),
+                             self._get_walked_fieldnames(values))
+
+    def test_get_fields_evaluate(self):
+        fields = self.form.get_fields(values={"string": u"bar"},
+                                      evaluate=True)
+        self.assertEqual(set(fields.keys()),
+                         set(["string", "default", "float"]))
+
 
 class TestFieldConfig(unittest.TestCase):
 
@@ -209,5 +276,48 @@ class TestFieldConfig(unittest.TestCase):
     def test_tags_custom(self):
         self.assertEqual(self.hfield.tags, ["tag1", "tag2"])
 
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for filename in ("form.xml", "include.xml", "inherited.xml"):
+            shutil.copy(os.path.join(test_dir, filename), self.tmpdir)
+        self.cache = ConfigCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _touch(self, filename):
+        path = os.path.join(self.tmpdir, filename)
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+    def test_get_cached(self):
+        path = os.path.join(self.tmpdir, "form.xml")
+        config = self.cache.get(path)
+        self.assertTrue(isinstance(config, Config))
+        self.assertTrue(self.cache.get(path) is config)
+        self.assertEqual(self.cache.stats(),
+                         {"hits": 1, "misses": 1, "size": 1})
+
+    def test_reload_on_changed_include(self):
+        path = os.path.join(self.tmpdir, "form.xml")
+        config = self.cache.get(path)
+        self._touch("include.xml")
+        self.assertFalse(self.cache.get(path) is config)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_reload_on_changed_parent(self):
+        path = os.path.join(self.tmpdir, "inherited.xml")
+        config = self.cache.get(path)
+        self._touch("form.xml")
+        self.assertFalse(self.cache.get(path) is config)
+
+    def test_invalidate(self):
+        path = os.path.join(self.tmpdir, "form.xml")
+        config = self.cache.get(path)
+        self.cache.invalidate(path)
+        self.assertFalse(self.cache.get(path) is config)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,7 @@
 import os
+import json
+import shutil
+import tempfile
 import datetime
 import unittest
 
@@ -12,8 +15,12 @@ Session.configure(bind=engine)
 Base = declarative_base()
 
 from formbar import test_dir
-from formbar.config import load, Config
+from formbar.config import load, parse, Config
 from formbar.form import Form, StateError, Validator
+from formbar.renderer import (FragmentCache, LRUCache, FieldRenderer,
+                              ClientManifest,
+                              configure_templates, preload_templates,
+                              get_template)
 
 RESULT="""<html><body><div class="formbar-form"><form id="customform" class="testcss" method="GET" action="http://" autocomplete="off"> <div class="row-fluid"> <div class="span12"> <label for="string"> String field</label> <div class="readonlyfield"> &nbsp; </div> </div> </div> <div class="row-fluid"> <div class="span6"> <label for="default"> Default</label> <div class="readonlyfield"> &nbsp; </div> </div> <div class="span6"> <label for="select"> Select</label> <div class="readonlyfield"> &nbsp; </div> </div> </div> <div class="row-fluid"> <div class="span6"> <label for="float"> Float field</label> <div class="readonlyfield"> &nbsp; </div> <div class="text-help"> <i class="icon-info-sign"></i> This is is a very long helptext which should span over multiple rows. Further the will check if there are further html tags allowed.</div> </div> <div class="span6"> <label for="date"> <sup>(1)</sup> Date field</label> <div class="readonlyfield"> &nbsp; </div> <div class="text-help"> <i class="icon-info-sign"></i> This is my helptext</div> </div> </div> <div class="row-fluid"> <div class="span6"> <label for="string"> String field</label> <div class="readonlyfield"> &nbsp; </div> </div> <div class="span6"> <label for="integer"> Integer field <a href="#" data-toggle="tooltip" class="formbar-tooltip" data-original-title="Required fa_field"><i class="icon-asterisk"></i></a></label> <div class="readonlyfield"> &nbsp; </div> </div> </div>
 </form></div></body></html>"""
@@ -162,12 +169,91 @@ class TestFormValidation(unittest.TestCase):
         warnings = self.form.get_warnings()
         self.assertEqual(len(warnings), 2)
 
+    def _new_form(self):
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        return Form(Config(tree).get_form('customform'))
+
+    def test_form_validate_incremental(self):
+        values = {'default': 'test', 'integer': '15', 'date': '1998-02-01'}
+        self.assertEqual(self.form.validate(values), False)
+        form = self._new_form()
+        self.assertEqual(form.validate_incremental({'integer': '16'},
+                                                   self.form.result), True)
+        self.assertEqual(form.data['integer'], 16)
+        self.assertEqual(form.data['date'], datetime.date(1998, 2, 1))
+        self.assertEqual(form.get_errors(), {})
+
+    def test_form_validate_incremental_equals_full(self):
+        values = {'default': 'test', 'integer': '16', 'date': '1998-02-01'}
+        self.form.validate(values)
+        changed = {'select': '2', 'integer': '15'}
+        incremental = self._new_form()
+        incremental.validate_incremental(changed, self.form.result)
+        values.update(changed)
+        full = self._new_form()
+        full.validate(values)
+        self.assertEqual(incremental.result.errors, full.result.errors)
+        self.assertEqual(incremental.result.warnings, full.result.warnings)
+        self.assertEqual(incremental.converted, full.converted)
+
+    def test_form_validate_incremental_external(self):
+        values = {'default': 'test', 'integer': '15', 'date': '1998-02-01'}
+        validator = Validator('integer', 'ext fail', lambda field, data: False)
+        self.form.add_validator(validator)
+        self.form.validate(values)
+        expected = self.form.get_errors()['integer']
+        self.assertEqual(expected.count('ext fail'), 1)
+        result = self.form.result
+        for i in range(2):
+            form = self._new_form()
+            form.add_validator(validator)
+            form.validate_incremental({'select': '2'}, result)
+            self.assertEqual(form.get_errors()['integer'], expected)
+            result = form.result
+
+    def test_form_validate_incremental_removed(self):
+        values = {'default': 'test', 'integer': '16', 'date': '1998-02-01',
+                  'select': '2'}
+        self.form.validate(values)
+        incremental = self._new_form()
+        incremental.validate_incremental({}, self.form.result,
+                                         removed=['select'])
+        del values['select']
+        full = self._new_form()
+        full.validate(values)
+        self.assertFalse('select' in incremental.submitted_data)
+        self.assertEqual(incremental.converted, full.converted)
+        self.assertEqual(incremental.result.errors, full.result.errors)
+
     def test_form_save_without_validation(self):
         self.assertRaises(StateError, self.form.save)
 
     def test_form_fields(self):
         self.assertEqual(len(self.form.fields.values()), 9)
 
+    def test_form_fields_lazy(self):
+        form = self._new_form()
+        created = len(form.fields.get_created())
+        self.assertTrue(created < len(form.fields))
+        field = form.fields['string']
+        self.assertTrue(form.fields['string'] is field)
+        self.assertEqual(len(form.fields.get_created()), created + 1)
+        self.assertTrue(field._renderer is None)
+        self.assertTrue(field.renderer is field.renderer)
+
+    def test_form_fields_mutable(self):
+        form = self._new_form()
+        field = form.fields['string']
+        del form.fields['string']
+        self.assertFalse('string' in form.fields)
+        self.assertRaises(KeyError, form.fields.__getitem__, 'string')
+        form.fields.update({'foo': field})
+        self.assertTrue(form.fields['foo'] is field)
+        self.assertEqual(list(form.fields)[-1], 'foo')
+        self.assertEqual(len(form.fields), 9)
+        # The schema of the configuration is not changed.
+        self.assertTrue('string' in self._new_form().fields)
+
     def test_form_field_select_options(self):
         selfield = self.form.get_field('select')
         self.assertEqual(len(selfield.get_options()), 4)
@@ -206,6 +292,161 @@ class TestFormRenderer(unittest.TestCase):
         form_config = config.get_form('customform')
         self.form = Form(form_config)
 
+    def _get_conditional_form(self):
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        config = Config(tree).get_form('conditionalform')
+        return Form(config, page_url="/page",
+                    values={'string': u'foo', 'integer': 16})
+
+    def test_form_render_only_page(self):
+        html = self._get_conditional_form().render(page=2, only_page=True)
+        self.assertTrue('pageurl="/page"' in html)
+        self.assertTrue('id="formbar-page-1" formbar-lazy="true"' in html)
+        self.assertTrue('<h1 class="page">Page 2</h1>' in html)
+        self.assertFalse('<h1 class="page">Page 1</h1>' in html)
+        # Values of the fields on the lazy page are rendered as hidden
+        # fields. Fields which are also on the selected page are not.
+        self.assertTrue('type="hidden" name="string" value="foo"' in html)
+        self.assertFalse('type="hidden" name="float"' in html)
+
+    def test_form_render_client_tree(self):
+        html = self._get_conditional_form().render()
+        self.assertTrue('expr="$string != &#39;foo&#39;" ast="[[&#34;group'
+                        in html)
+
+    def _get_manifest(self, html):
+        start = html.index('class="formbar-manifest" type="application/json">')
+        start = html.index(">", start) + 1
+        return json.loads(html[start:html.index("</script>", start)])
+
+    def test_form_render_manifest(self):
+        html = self._get_conditional_form().render()
+        manifest = self._get_manifest(html)
+        self.assertEqual(manifest["fields"]["integer"],
+                         {"state": "active", "desired": "False",
+                          "required": "True",
+                          "rules": [{"expr": "bool($integer)",
+                                     "type": "error"},
+                                    {"expr": "$integer ge 16",
+                                     "type": "error"}]})
+        self.assertEqual(manifest["fields"]["default"]["state"], "inactive")
+        for id_, conditional in manifest["conditionals"].items():
+            self.assertTrue('id="%s"' % id_ in html)
+        self.assertTrue({"expr": "$string != 'foo'", "fields": ["string"]}
+                        in [{"expr": c["expr"], "fields": c["fields"]}
+                            for c in manifest["conditionals"].values()])
+
+    def test_manifest_conditional_variables(self):
+        manifest = ClientManifest()
+        elem = parse('<if expr="($a == 1) and bool($b.c)"/>')
+        manifest.add_conditional(elem)
+        self.assertEqual(manifest.conditionals[str(id(elem))]["fields"],
+                         ["a", "b.c"])
+
+    def test_form_render_page_manifest(self):
+        html = self._get_conditional_form().render_page(1)
+        manifest = self._get_manifest(html)
+        self.assertEqual(sorted(manifest["fields"].keys()),
+                         ["float", "integer", "string"])
+
+    def test_form_render_page_out_of_range(self):
+        form = self._get_conditional_form()
+        self.assertRaises(ValueError, form.render_page, 0)
+        self.assertRaises(ValueError, form.render_page, -1)
+        self.assertRaises(ValueError, form.render_page, len(form.pages) + 1)
+
+    def test_renderer_formgroup(self):
+        field = self._get_conditional_form().get_field('string')
+
+        class CustomRenderer(FieldRenderer):
+            def render(self):
+                return u"<span></span>"
+
+        class CustomGroupRenderer(CustomRenderer):
+            formgroup = True
+
+        translate = field._form._translate
+        self.assertTrue(FieldRenderer(field, translate).formgroup)
+        self.assertFalse(CustomRenderer(field, translate).formgroup)
+        self.assertTrue(CustomGroupRenderer(field, translate).formgroup)
+
+    def test_form_render_page(self):
+        html = self._get_conditional_form().render_page(1)
+        self.assertTrue('<h1 class="page">Page 1</h1>' in html)
+        self.assertTrue('name="string" value="foo"' in html)
+        self.assertFalse('<form' in html)
+
+    def _normalize(self, html):
+        return " ".join(html.split())
+
+    def test_form_render_iter(self):
+        parts = list(self.form.render_iter())
+        self.assertTrue(len(parts) > 3)
+        self.assertEqual(self._normalize("".join(parts)),
+                         self._normalize(self.form.render()))
+
+    def test_form_render_iter_only_page(self):
+        form = self._get_conditional_form()
+        parts = list(form.render_iter(page=2, only_page=True))
+        html = form.render(page=2, only_page=True)
+        self.assertEqual(self._normalize("".join(parts)),
+                         self._normalize(html))
+        self.assertTrue('formbar-lazy="true"' in parts[2])
+
+    def test_fragment_cache(self):
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        config = Config(tree).get_form('readonlyform')
+        cache = FragmentCache(maxsize=10)
+        html = Form(config, fragment_cache=cache,
+                    values={'string': u'foo', 'integer': 16}).render()
+        self.assertEqual(cache.misses, 2)
+        html2 = Form(config, fragment_cache=cache,
+                     values={'string': u'foo', 'integer': 16}).render()
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(html, html2)
+        # Other values and locales are rendered again.
+        Form(config, fragment_cache=cache, locale="de",
+             values={'string': u'foo', 'integer': 16}).render()
+        html3 = Form(config, fragment_cache=cache,
+                     values={'string': u'bar', 'integer': 16}).render()
+        self.assertEqual(cache.misses, 5)
+        self.assertTrue('bar' in html3)
+
+    def test_fragment_cache_configs(self):
+        xml = ('<configuration><source>'
+               '<entity id="e1" name="name" label="%s" type="string"/>'
+               '</source><form id="update" readonly="true">'
+               '<field ref="e1"/></form></configuration>')
+        cache = FragmentCache(maxsize=10)
+        html = []
+        for label in ("Foo label", "Bar label"):
+            config = Config(parse(xml % label)).get_form("update")
+            html.append(Form(config, fragment_cache=cache,
+                             values={'name': u'x'}).render())
+        self.assertEqual(cache.hits, 0)
+        self.assertTrue("Foo label" in html[0])
+        self.assertTrue("Bar label" in html[1])
+
+    def test_fragment_cache_page(self):
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        config = Config(tree).get_form('readonlyform')
+        cache = FragmentCache(backend={})
+        form = Form(config, fragment_cache=cache, values={'string': u'foo'})
+        html = form.render_page(1)
+        self.assertEqual(form.render_page(1), html)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(len(cache.backend), 3)
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache["a"] = u"1"
+        cache["b"] = u"2"
+        cache.get("a")
+        cache["c"] = u"3"
+        self.assertTrue("a" in cache)
+        self.assertFalse("b" in cache)
+        self.assertEqual(len(cache), 2)
+
     # Disable this test. Find better way to check if the rendering is
     # ok.
     #def test_form_render(self):
@@ -215,6 +456,92 @@ class TestFormRenderer(unittest.TestCase):
     #    self.assertEqual(html, check)
 
 
+class TestTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.module_directory = tempfile.mkdtemp()
+        configure_templates(self.module_directory)
+
+    def tearDown(self):
+        configure_templates()
+        shutil.rmtree(self.module_directory)
+
+    def test_preload(self):
+        names = preload_templates()
+        self.assertTrue("form.mako" in names)
+        self.assertTrue("form.mako.py" in os.listdir(self.module_directory))
+        self.assertTrue(get_template("form.mako") is get_template("form.mako"))
+
+    def test_filesystem_checks(self):
+        from formbar import renderer
+        get_template("form.mako")
+        # The lookup checks the template file on every call.
+        self.assertEqual(renderer._templates, {})
+        configure_templates(self.module_directory, filesystem_checks=False)
+        template = get_template("form.mako")
+        self.assertTrue(renderer._templates["form.mako"] is template)
+
+    def test_render_compiled(self):
+        preload_templates(["form.mako", "label.mako"])
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        form = Form(Config(tree).get_form('customform'))
+        self.assertTrue('id="customform"' in form.render())
+
+
+class TestOptionIndex(unittest.TestCase):
+
+    def setUp(self):
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        self.form = Form(Config(tree).get_form('customform'))
+
+    def test_expand_value(self):
+        field = self.form.get_field('select')
+        self.assertEqual(field.expand_value(4), "Value 4")
+        # Labels are in the order of the options.
+        self.assertEqual(field.expand_value([2, "4", 9]), "Value 4, Value 2")
+        self.assertEqual(field.get_option_index().keys(),
+                         [u"4", u"1", u"2", u"3"])
+
+    def test_options_loaded_once(self):
+        field = self.form.get_field('select')
+        calls = []
+        get_options = field.get_options
+        field.get_options = lambda: calls.append(1) or get_options()
+        field.expand_value(1)
+        field.get_value(expand=True)
+        field.renderer.render()
+        self.assertEqual(len(calls), 1)
+        field.clear_options()
+        field.expand_value(1)
+        self.assertEqual(len(calls), 2)
+
+
+class TestOptionTable(unittest.TestCase):
+
+    def setUp(self):
+        tree = load(os.path.join(test_dir, 'form.xml'))
+        self.config = Config(tree).get_form('optionform')
+
+    def test_options(self):
+        field = Form(self.config).get_field('kinds')
+        self.assertEqual(field.get_options(), [("Alpha", 3, False),
+                                               ("Bravo", 2, True),
+                                               ("Charlie", 1, False),
+                                               ("Delta", 4, True)])
+        # Same result as filtering every option.
+        options = field.filter_options(self.config.get_field('kinds').options)
+        options = [(o[0], int(o[1]), o[2]) for o in options]
+        self.assertEqual(sorted(field.get_options()), sorted(options))
+
+    def test_shared_table(self):
+        table = Form(self.config).get_field('kinds').get_option_table()
+        self.assertTrue(Form(self.config).get_field('kinds')
+                        .get_option_table() is table)
+        self.assertEqual(table.values, (3, 2, 1, 4))
+        self.assertEqual(table.get_column("kind"), (u"", u"a", u"b", u"a"))
+        self.assertEqual(table.get_column("foo"), (u"",) * 4)
+
+
 class TestFormAlchemyForm(unittest.TestCase):
 
     def _insert_item(self):
@@ -0,0 +1,82 @@
+import os
+import hashlib
+import unittest
+from formbar import test_dir, static_dir
+from formbar.config import Config, load, parse
+from formbar.form import Form
+from formbar.helpers import (get_bundle, get_css, get_js, minify_css,
+                             minify_js, uses_editor)
+
+EDITOR = """
+<configuration>
+  <source>
+    <entity id="e1" name="xml" label="XML" type="string">
+      <renderer type="formbareditor"/>
+    </entity>
+  </source>
+  <form id="editor"><field ref="e1"/></form>
+</configuration>"""
+
+
+class TestMinify(unittest.TestCase):
+
+    def test_minify_css(self):
+        css = 'a  >  b , c {\n  /* comment */\n  color: red ;\n}\n'
+        self.assertEqual(minify_css(css), 'a>b,c{color: red;}')
+
+    def test_minify_css_keeps_strings(self):
+        css = 'a:after { content: "x  /* y */" ; }'
+        self.assertEqual(minify_css(css), 'a:after{content: "x  /* y */";}')
+
+    def test_minify_js(self):
+        js = "function foo() {\n    // comment\n\n    return 1\n}\n"
+        self.assertEqual(minify_js(js), "function foo() {\nreturn 1\n}")
+
+
+class TestBundle(unittest.TestCase):
+
+    def test_cached(self):
+        bundle = get_bundle("js")
+        self.assertTrue(get_bundle("js") is bundle)
+        self.assertTrue(bundle.content is get_bundle("js").content)
+
+    def test_hash(self):
+        bundle = get_bundle("css")
+        self.assertEqual(bundle.hash, hashlib.sha1(bundle.content).hexdigest())
+        self.assertEqual(bundle.etag, '"%s"' % bundle.hash)
+        self.assertEqual(bundle.filename,
+                         "formbar-css.%s.css" % bundle.hash[:12])
+        self.assertEqual(bundle.content_type, "text/css")
+
+    def test_unminified(self):
+        bundle = get_bundle("js", minify=False)
+        self.assertTrue("// " in bundle.content)
+        self.assertNotEqual(bundle.hash, get_bundle("js").hash)
+
+    def test_minified_dirs(self):
+        with open(os.path.join(static_dir, "js/ace/mode-xml.js")) as f:
+            self.assertTrue(f.read() in get_bundle("editor").content)
+
+    def test_unknown(self):
+        self.assertRaises(KeyError, get_bundle, "foo")
+
+    def test_editor_bundle(self):
+        self.assertTrue("ace.define" in get_bundle("editor").content)
+        self.assertFalse("ace.define" in get_bundle("js").content)
+        self.assertTrue(get_js() is get_bundle("all").content)
+        self.assertTrue("ace.define" in get_js())
+        self.assertFalse("ace.define" in get_js(editor=False))
+        self.assertEqual(get_css(), get_bundle("css").content)
+
+
+class TestUsesEditor(unittest.TestCase):
+
+    def test_editor(self):
+        config = Config(parse(EDITOR))
+        form = Form(config.get_form("editor"))
+        self.assertTrue(uses_editor(form))
+        self.assertEqual(form.fields.get_created(), [])
+
+    def test_no_editor(self):
+        config = Config(load(os.path.join(test_dir, 'form.xml')))
+        self.assertFalse(uses_editor(Form(config.get_form("customform"))))
@@ -0,0 +1,244 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Table
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import event
+
+from formbar import test_dir
+from formbar.config import load, Config
+from formbar.form import Form
+from formbar.fields import (RelationOptionLoader, CollectionField,
+                            build_filter_clause)
+from formbar.rules import get_ast
+from formbar.converters import load_items, DeserializeException
+
+engine = create_engine('sqlite:///:memory:', echo=False)
+Session = sessionmaker(bind=engine)
+Base = declarative_base()
+
+nm_table = Table('items_tags', Base.metadata,
+                 Column('iid', Integer, ForeignKey('items.id')),
+                 Column('tid', Integer, ForeignKey('tags.id')))
+
+
+class Group(Base):
+    __tablename__ = 'groups'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+    def __unicode__(self):
+        return self.name
+
+
+class Tag(Base):
+    __tablename__ = 'tags'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+    def __unicode__(self):
+        return self.name
+
+
+class Item(Base):
+    __tablename__ = 'items'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    gid = Column(Integer, ForeignKey('groups.id'))
+    oid = Column(Integer, ForeignKey('groups.id'))
+    group = relationship(Group, foreign_keys=[gid])
+    owner = relationship(Group, foreign_keys=[oid])
+    tags = relationship(Tag, secondary=nm_table)
+
+    def get_values(self):
+        return {"name": self.name}
+
+
+class RelationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        Base.metadata.create_all(engine)
+        self.session = Session()
+        for i in range(1, 6):
+            self.session.add(Group(id=i, name=u"Group %s" % i))
+            self.session.add(Tag(id=i, name=u"Tag %s" % i))
+        self.item = Item(name=u"Item")
+        self.session.add(self.item)
+        self.session.commit()
+        self.config = Config(load(os.path.join(test_dir, 'relations.xml')))
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(engine, "before_cursor_execute", self._count)
+        self.session.close()
+        Base.metadata.drop_all(engine)
+
+    def _count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def get_form(self, **kwargs):
+        return Form(self.config.get_form('update'), self.item,
+                    self.session, **kwargs)
+
+
+class TestRelationOptionLoader(RelationTestCase):
+
+    def test_one_query_per_class(self):
+        form = self.get_form()
+        group = form.get_field("group").get_options()
+        owner = form.get_field("owner").get_options()
+        tags = form.get_field("tags").get_options()
+        self.assertEqual(len(group), 6)
+        self.assertEqual(owner, group)
+        self.assertEqual(len(tags), 5)
+        self.assertEqual(form._option_loader.queries, 2)
+        del self.statements[:]
+        form.render()
+        self.assertEqual(self.statements, [])
+
+    def test_shared_loader(self):
+        loader = RelationOptionLoader(self.session)
+        self.get_form(option_loader=loader).get_field("group").get_options()
+        self.get_form(option_loader=loader).get_field("owner").get_options()
+        self.assertEqual(loader.queries, 1)
+
+
+class TestBulkConverters(RelationTestCase):
+
+    def test_load_items(self):
+        del self.statements[:]
+        items = load_items(Tag, [4, 2, 5, 1], self.session, chunksize=3)
+        self.assertEqual([i.id for i in items], [4, 2, 5, 1])
+        self.assertEqual(len(self.statements), 2)
+
+    def test_load_items_missing(self):
+        self.assertRaises(DeserializeException, load_items, Tag, [1, 9, 8],
+                          self.session)
+
+    def test_manytomany(self):
+        form = self.get_form()
+        del self.statements[:]
+        self.assertTrue(form.validate({"tags": ["3", "1", "2"],
+                                       "group": "2"}))
+        self.assertEqual([t.id for t in form.data["tags"]], [3, 1, 2])
+        self.assertEqual(form.data["group"].id, 2)
+        # All new tags are loaded with one query.
+        self.assertEqual(len([s for s in self.statements
+                              if "FROM tags" in s]), 1)
+
+    def test_missing_id(self):
+        form = self.get_form()
+        self.assertFalse(form.validate({"tags": ["1", "99"], "group": "98"}))
+        errors = form.get_errors()
+        self.assertTrue("99" in errors["tags"][0])
+        self.assertTrue("98" in errors["group"][0])
+
+class TestRemoteSelection(RelationTestCase):
+
+    def get_form(self, **kwargs):
+        return Form(self.config.get_form('remote'), self.item,
+                    self.session, **kwargs)
+
+    def test_search_paging(self):
+        field = self.get_form().get_field("group")
+        result = field.search_options(pagesize=2)
+        self.assertEqual([o["value"] for o in result["options"]], [1, 2])
+        self.assertTrue(result["more"])
+        result = field.search_options(page=3, pagesize=2)
+        self.assertEqual([o["value"] for o in result["options"]], [5])
+        self.assertFalse(result["more"])
+
+    def test_search_label(self):
+        field = self.get_form().get_field("group")
+        result = field.search_options(u"group 3")
+        self.assertEqual(result["options"], [{"label": u"Group 3",
+                                              "value": 3}])
+
+    def test_search_column(self):
+        field = self.get_form().get_field("tags")
+        result = field.search_options(u"tag")
+        self.assertEqual([o["value"] for o in result["options"]],
+                         [1, 2, 3, 4, 5])
+        del self.statements[:]
+        result = field.search_options(u"4")
+        self.assertEqual([o["value"] for o in result["options"]], [4])
+        self.assertTrue("LIKE" in self.statements[0].upper())
+
+    def test_search_page_in_db(self):
+        field = self.get_form().get_field("tags")
+        del self.statements[:]
+        result = field.search_options(u"tag", page=2, pagesize=2)
+        self.assertEqual([o["value"] for o in result["options"]], [3, 4])
+        self.assertTrue(result["more"])
+        self.assertEqual(len(self.statements), 1)
+        self.assertTrue("LIMIT" in self.statements[0].upper())
+        self.assertTrue("ORDER BY" in self.statements[0].upper())
+
+    def test_search_escaped(self):
+        self.session.add(Tag(id=6, name=u"50% off"))
+        self.session.add(Tag(id=7, name=u"a_b"))
+        self.session.commit()
+        field = self.get_form().get_field("tags")
+        result = field.search_options(u"% ")
+        self.assertEqual([o["value"] for o in result["options"]], [6])
+        result = field.search_options(u"a_")
+        self.assertEqual([o["value"] for o in result["options"]], [7])
+
+    def test_render_selected_only(self):
+        self.item.group = self.session.query(Group).get(2)
+        self.item.tags = [self.session.query(Tag).get(3)]
+        self.session.commit()
+        form = self.get_form()
+        self.assertEqual([o[1] for o in
+                          form.get_field("tags").get_selected_options()], [3])
+        del self.statements[:]
+        html = form.render()
+        self.assertTrue('formbar-optionurl="/options"' in html)
+        self.assertTrue("Group 2" in html)
+        self.assertTrue("Tag 3" in html)
+        self.assertFalse("Group 1" in html)
+        self.assertFalse("Tag 1" in html)
+        # No query loads all options.
+        self.assertEqual([s for s in self.statements if "WHERE" not in s],
+                         [])
+
+class TestSQLFilter(RelationTestCase):
+
+    def get_field(self, form_id):
+        form = Form(self.config.get_form(form_id), self.item, self.session)
+        return form.get_field("tags")
+
+    def test_filter_in_db(self):
+        field = self.get_field("filtered")
+        self.assertTrue(field.get_filter_clause(Tag) is not None)
+        options = field.get_options()
+        self.assertEqual([o[1] for o in options if o[2]], [1, 3])
+        # Same result as evaluating the filter for each option.
+        items = self.session.query(Tag).all()
+        self.assertEqual(options, list(
+            CollectionField.iter_filtered_options(field, items)))
+
+    def test_search_in_db(self):
+        field = self.get_field("filtered")
+        result = field.search_options()
+        self.assertEqual([o["value"] for o in result["options"]], [1, 3])
+
+    def test_fallback(self):
+        field = self.get_field("fallback")
+        self.assertEqual(field.get_filter_clause(Tag), None)
+        options = field.get_options()
+        self.assertEqual([o[1] for o in options if o[2]], [4, 5])
+
+    def test_null_values(self):
+        self.session.add(Tag(id=6, name=None))
+        clause = build_filter_clause(Tag, get_ast("$name != 'Tag 1'"))
+        ids = [i for i, in self.session.query(Tag.id).filter(clause)]
+        self.assertEqual(ids, [2, 3, 4, 5, 6])
+        clause = build_filter_clause(Tag, get_ast("not ($name == 'Tag 1')"))
+        ids = [i for i, in self.session.query(Tag.id).filter(clause)]
+        self.assertEqual(ids, [2, 3, 4, 5, 6])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+from formbar.rules import (Rule, Expression, ExpressionCache,
+                           expression_cache, get_ast, evaluate_columns,
+                           evaluate_rules, get_client_tree, get_variables)
+
+
+class TestExpressionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ExpressionCache(maxsize=2)
+
+    def test_parse_once(self):
+        tree = self.cache.get("$foo == 1")
+        self.assertTrue(self.cache.get("$foo == 1") is tree)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_lru_eviction(self):
+        self.cache.get("$a == 1")
+        self.cache.get("$b == 1")
+        # Mark $a as recently used so $b will be evicted.
+        self.cache.get("$a == 1")
+        self.cache.get("$c == 1")
+        stats = self.cache.stats()
+        self.assertEqual(stats["size"], 2)
+        self.cache.get("$b == 1")
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_unicode_and_bytes(self):
+        unicode_tree = self.cache.get(u"$a == 1")
+        bytes_tree = self.cache.get("$a == 1")
+        self.assertFalse(unicode_tree is bytes_tree)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_mixed_rules(self):
+        Rule(u"$a == 1")
+        self.assertTrue(Rule("$a == 1").evaluate({"a": 1}))
+
+    def test_rules_share_tree(self):
+        r1 = Rule("$foo == 'bar'", "msg1", "pre")
+        r2 = Rule("$foo == 'bar'", "msg2", "post", "warning")
+        self.assertTrue(r1._expression_tree is r2._expression_tree)
+        self.assertTrue(r1.evaluate({"foo": u"bar"}))
+        self.assertFalse(r2.evaluate({"foo": u"baz"}))
+
+    def test_expression_evaluate(self):
+        self.assertEqual(Expression("$foo + 1").evaluate({"foo": 1}), 2)
+        self.assertTrue((str, "$foo + 1") in expression_cache._trees)
+
+class TestAST(unittest.TestCase):
+
+    def test_operators(self):
+        self.assertEqual(get_ast("$a == 'x' and not ($b in [1, 2])"),
+                         ["and", ["==", ["var", "a"], ["lit", u"x"]],
+                          ["not", ["in", ["var", "b"], ["lit", [1, 2]]]]])
+
+    def test_left_to_right(self):
+        self.assertEqual(get_ast("$a + 1 + 2"),
+                         ["+", ["+", ["var", "a"], ["lit", 1]], ["lit", 2]])
+
+    def test_function(self):
+        self.assertEqual(get_ast("bool($a) or $b"),
+                         ["or", ["call", "bool", ["var", "a"]],
+                          ["var", "b"]])
+
+
+class TestEvaluateColumns(unittest.TestCase):
+
+    columns = {"a": (u"x", u"y", u"", u"x"),
+               "b": (u"1", u"2", u"3", u"x")}
+
+    def evaluate(self, expr):
+        return evaluate_columns(get_ast(expr), self.columns.get, 4)
+
+    def test_same_as_rule(self):
+        for expr in ["$a == 'x'",
+                     "'x' != $a",
+                     "$a == $b",
+                     "$b > '1' and $a != ''",
+                     "not ($a == 'y') or $b == '3'",
+                     "$b in ['1', '3']",
+                     "$a"]:
+            rule = Rule(expr)
+            rows = [dict((k, v[i]) for k, v in self.columns.items())
+                    for i in range(4)]
+            self.assertEqual(self.evaluate(expr),
+                             [rule.evaluate(row) for row in rows], expr)
+
+    def test_unsupported(self):
+        for expr in ["$b == 1", "'x' in $a", "bool($a)", "$a + 'x'"]:
+            self.assertRaises(ValueError, self.evaluate, expr)
+
+
+class TestEvaluateRules(unittest.TestCase):
+
+    def test_evaluate_rules(self):
+        rules = ["$a == 1", Rule("$a > 1"), "'x' > 1"]
+        self.assertEqual(evaluate_rules(rules, {"a": 1}),
+                         [True, False, None])
+
+    def test_evaluate_without_values(self):
+        self.assertEqual(evaluate_rules(["1 == 1", "'a' == 'b'"]),
+                         [True, False])
+
+
+class TestClientTree(unittest.TestCase):
+
+    def test_tokens(self):
+        self.assertEqual(get_client_tree("$a == 'x' and ($b ge 1.5)"),
+                         [["group", [["group", [["var", "$a"],
+                                                ["op", "=="],
+                                                ["str", "x"]]],
+                                     ["op", "and"],
+                                     ["group", [["var", "$b"],
+                                                ["op", ">="],
+                                                ["float", 1.5]]]]]])
+
+    def test_functions(self):
+        self.assertEqual(get_client_tree("bool($a)"),
+                         [["call", "bool", ["var", "$a"]]])
+        self.assertEqual(get_client_tree("$a in [1, '$b']"),
+                         [["group", [["var", "$a"], ["op", "in"],
+                                     ["list", [["int", 1], ["str", "$b"]]]]]])
+        # Functions depending on the server are not evaluated on the
+        # client.
+        self.assertEqual(get_client_tree("date('today') > $a"), None)
+
+
+class TestVariables(unittest.TestCase):
+
+    def test_variables(self):
+        self.assertEqual(get_variables("($a == 1) and bool($b.c)"),
+                         ["a", "b.c"])
+        self.assertEqual(get_variables("$a != 'x'"), ["a"])
+        self.assertEqual(get_variables("1 == 1"), [])
+
+if __name__ == '__main__':
+    unittest.main()